@@ -1,28 +1,54 @@
 import requests
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from tenacity import Retrying, wait_fixed, retry_if_exception_type
 from config import Config
+from endpoint_pool import EndpointPool, SUCCESS, FAILURE, RATE_LIMITED, REJECTED
+from budget import estimate_tokens
+from deadline import Deadline
 import time
 
+RETRY_WAIT = 2        # 重试间隔(秒)
+MIN_ATTEMPT_TIME = 1  # 剩余时间不足以完成一次请求时不再重试(秒)
+
+class RateLimited(requests.RequestException):
+    """端点返回429"""
+
+class EndpointError(ValueError):
+    """端点故障（5xx、连接错误、超时），计入熔断"""
+
+def _retry_stop(deadline):
+    """重试次数用尽、已取消或剩余时间不够下一次尝试时停止重试"""
+    def stop(retry_state):
+        if retry_state.attempt_number >= Config.MAX_RETRIES or deadline.cancelled():
+            return True
+        remaining = deadline.remaining()
+        return remaining is not None and remaining < RETRY_WAIT + MIN_ATTEMPT_TIME
+    return stop
+
 class AIClient:
-    def __init__(self):
-        self.api_key = Config.API_KEY
-        self.base_url = Config.BASE_URL
-        self.model = Config.MODEL_NAME
-
-    @retry(
-        stop=stop_after_attempt(Config.MAX_RETRIES),
-        wait=wait_fixed(2),
-        retry=retry_if_exception_type((requests.RequestException, ValueError))
-    )
-    def chat(self, messages):
+    def __init__(self, pool=None, budget=None):
+        # 多个Proofreader共享同一个端点池，才能做全局负载均衡
+        self.pool = pool or EndpointPool.from_config()
+        # 运行预算（RunBudget），用尽时抛出BudgetExceeded且不重试
+        self.budget = budget
+
+    def chat(self, messages, deadline=None):
         """
         messages: [{"role": "user", "content": "..."}]
+        每次尝试都从端点池重新选择端点，重试会自然转移到其他健康端点
+        deadline: 截止时间，决定单次请求超时和剩余可重试次数，取消后立即停止
         """
-        url = f"{self.base_url}/responses"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        deadline = deadline or Deadline()
+        retryer = Retrying(
+            stop=_retry_stop(deadline),
+            wait=wait_fixed(RETRY_WAIT),
+            retry=retry_if_exception_type((requests.RequestException, ValueError)),
+            sleep=deadline.sleep
+        )
+        return retryer(self._chat_once, messages, deadline)
+
+    def _chat_once(self, messages, deadline):
+        """单次请求尝试"""
+        deadline.check()
 
         # 拼接 messages 成单条 input
         input_text = ""
@@ -31,48 +57,84 @@ class AIClient:
             content = msg.get("content", "")
             input_text += f"[{role}]: {content}\n"
 
+        if self.budget is not None:
+            self.budget.reserve(estimate_tokens(input_text))
+
+        endpoint = self.pool.acquire(timeout=deadline.remaining())
+        # 只有端点故障计入熔断，限流和请求本身的错误（400等）不会剔除端点
+        outcome = REJECTED
+        start_time = time.time()
+        try:
+            data = self._post(endpoint, input_text, deadline.timeout_for(Config.REQUEST_TIMEOUT))
+            outcome = SUCCESS
+        except RateLimited:
+            outcome = RATE_LIMITED
+            raise
+        except EndpointError:
+            outcome = FAILURE
+            raise
+        finally:
+            self.pool.release(endpoint, outcome, time.time() - start_time)
+
+        content = self._extract_content(data)
+        if self.budget is not None:
+            usage = data.get("usage") if isinstance(data.get("usage"), dict) else {}
+            self.budget.record_output(usage.get("output_tokens") or estimate_tokens(content))
+        return content
+
+    def _post(self, endpoint, input_text, timeout):
+        """向指定端点发送请求，返回解析后的JSON"""
+        url = f"{endpoint.base_url}/responses"
+        headers = {
+            "Authorization": f"Bearer {endpoint.api_key}",
+            "Content-Type": "application/json"
+        }
         payload = {
-            "model": self.model,
+            "model": endpoint.model,
             "input": input_text,
             "temperature": Config.TEMPERATURE
         }
 
         try:
-            resp = requests.post(url, json=payload, headers=headers, timeout=30)
+            resp = requests.post(url, json=payload, headers=headers, timeout=timeout)
+
+            if resp.status_code == 429:  # 速率限制，端点暂停分配一段时间后重试
+                print(f"⚠️ 端点 {endpoint.name} 遇到速率限制，稍后重试...")
+                raise RateLimited("Rate limit exceeded")
 
-            if resp.status_code == 429:  # 速率限制
-                print("⚠️ 遇到速率限制，等待后重试...")
-                time.sleep(5)
-                raise requests.RequestException("Rate limit exceeded")
+            if resp.status_code >= 500:
+                raise EndpointError(f"API请求失败: {resp.status_code} {resp.text}")
 
             if resp.status_code != 200:
                 raise ValueError(f"API请求失败: {resp.status_code} {resp.text}")
 
             try:
-                data = resp.json()
+                return resp.json()
             except:
                 raise ValueError(f"API返回不是JSON: {resp.text}")
 
-            # 云雾 API 返回 content 或 output[0].content
-            if "content" in data:
-                content = data["content"]
-                # 如果content是列表，提取文本
-                if isinstance(content, list):
-                    if len(content) > 0 and isinstance(content[0], dict):
-                        return content[0].get("text", str(content))
-                    else:
-                        return str(content)
-                return content
-            elif "output" in data and len(data["output"]) > 0:
-                output_item = data["output"][0]
-                if isinstance(output_item, dict):
-                    return output_item.get("content", output_item.get("text", ""))
-                else:
-                    return str(output_item)
-            else:
-                return str(data)
-
         except requests.Timeout:
-            raise ValueError("API请求超时")
+            raise EndpointError("API请求超时")
         except requests.ConnectionError:
-            raise ValueError("网络连接错误")
+            raise EndpointError("网络连接错误")
+
+    def _extract_content(self, data):
+        """从API响应中提取文本内容"""
+        # 云雾 API 返回 content 或 output[0].content
+        if "content" in data:
+            content = data["content"]
+            # 如果content是列表，提取文本
+            if isinstance(content, list):
+                if len(content) > 0 and isinstance(content[0], dict):
+                    return content[0].get("text", str(content))
+                else:
+                    return str(content)
+            return content
+        elif "output" in data and len(data["output"]) > 0:
+            output_item = data["output"][0]
+            if isinstance(output_item, dict):
+                return output_item.get("content", output_item.get("text", ""))
+            else:
+                return str(output_item)
+        else:
+            return str(data)
@@ -0,0 +1,60 @@
+import math
+import re
+import threading
+
+# 中日韩字符大致一个字符一个token，其余文本按约4个字符一个token估算
+CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]')
+
+
+def estimate_tokens(text) -> int:
+    """粗略估算文本的token数"""
+    if not text:
+        return 0
+    text = str(text)
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class BudgetExceeded(RuntimeError):
+    """运行预算已用尽，停止派发新请求"""
+
+
+class RunBudget:
+    """整次运行的token/请求数硬上限（None表示不限制），线程安全"""
+
+    def __init__(self, max_tokens=None, max_requests=None):
+        self.max_tokens = max_tokens
+        self.max_requests = max_requests
+        self.used_tokens = 0
+        self.used_requests = 0
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    def reserve(self, prompt_tokens: int):
+        """发送请求前登记，超出预算时抛出BudgetExceeded"""
+        with self._lock:
+            if self.exhausted:
+                raise BudgetExceeded("运行预算已用尽")
+            if self.max_requests is not None and self.used_requests >= self.max_requests:
+                self.exhausted = True
+                raise BudgetExceeded(f"请求数达到上限 {self.max_requests}")
+            if self.max_tokens is not None and self.used_tokens + prompt_tokens > self.max_tokens:
+                self.exhausted = True
+                raise BudgetExceeded(f"token数达到上限 {self.max_tokens}")
+            self.used_requests += 1
+            self.used_tokens += prompt_tokens
+
+    def record_output(self, output_tokens: int):
+        """登记响应消耗的token"""
+        with self._lock:
+            self.used_tokens += output_tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                "used_tokens": self.used_tokens,
+                "used_requests": self.used_requests,
+                "max_tokens": self.max_tokens,
+                "max_requests": self.max_requests,
+                "exhausted": self.exhausted
+            }
@@ -0,0 +1,61 @@
+import os
+from utils import load_json, save_json
+
+CHECKPOINT_FILENAME = "checkpoint.json"
+
+
+def checkpoint_path(report_folder):
+    return os.path.join(report_folder, CHECKPOINT_FILENAME)
+
+
+def load_checkpoint(report_folder):
+    """读取断点，返回 {base_name: {original_index: report}}"""
+    path = checkpoint_path(report_folder)
+    if not os.path.exists(path):
+        return {}
+    try:
+        data = load_json(path)
+    except Exception as e:
+        print(f"⚠ 断点文件无法读取，忽略: {e}")
+        return {}
+    return {
+        base_name: {r['original_index']: r for r in entry.get('reports', [])}
+        for base_name, entry in data.get('files', {}).items()
+    }
+
+
+def save_checkpoint(report_folder, results):
+    """保存各文件已完成的报告（与已有断点合并），供下次运行跳过"""
+    path = checkpoint_path(report_folder)
+    files = {}
+    if os.path.exists(path):
+        try:
+            files = load_json(path).get('files', {})
+        except Exception:
+            files = {}
+    for result in results:
+        files[result['base_name']] = {
+            "filename": result['filename'],
+            "complete": not result.get('stopped', False),
+            # 出错的条目不写入断点，下次重新处理
+            "reports": [r for r in result['reports'] if not r.get('error')]
+        }
+    save_json({"files": files}, path)
+    return path
+
+
+def clear_checkpoint(report_folder, base_names):
+    """移除已完整处理的文件的断点记录，全部清空时删除断点文件"""
+    path = checkpoint_path(report_folder)
+    if not os.path.exists(path):
+        return
+    try:
+        files = load_json(path).get('files', {})
+    except Exception:
+        files = {}
+    for base_name in base_names:
+        files.pop(base_name, None)
+    if files:
+        save_json({"files": files}, path)
+    else:
+        os.remove(path)
@@ -8,6 +8,16 @@ class Config:
     # 使用的模型名称
     MODEL_NAME = "gpt-5.2"
     
+    # 多端点/多密钥配置，为空时只使用上面的 BASE_URL 和 API_KEY
+    # 示例: {"name": "主线路", "base_url": "https://yunwu.ai/v1", "api_key": "sk-...", "max_concurrent": 5}
+    # model 可选，默认使用 MODEL_NAME；max_concurrent 可选，默认使用 CONCURRENT_REQUESTS
+    ENDPOINTS = []
+    
+    # 熔断配置
+    CIRCUIT_FAILURE_THRESHOLD = 3  # 端点连续失败次数达到该值后熔断
+    CIRCUIT_COOLDOWN = 30          # 熔断冷却时间(秒)，到期后放行一个探测请求
+    RATE_LIMIT_BACKOFF = 5         # 端点返回429后暂停向其分配请求的时间(秒)，不计入熔断
+    
     # 批处理大小
     BATCH_SIZE = 3
     
@@ -24,7 +34,44 @@ class Config:
     
     # 文件并行处理配置
     CONCURRENT_FILES = 3     # 同时处理的文件数量
-    FILE_PROCESSING_TIMEOUT = 300  # 文件处理超时时间(秒)
+    FILE_PROCESSING_TIMEOUT = None # 单个文件处理超时时间(秒)，None为不限制
+    
+    # 截止时间配置（超时后停止派发并保存断点）
+    RUN_TIMEOUT = None       # 整次运行超时时间(秒)，None为不限制
+    ITEM_TIMEOUT = 120       # 单条（或单个窗口）含重试的总超时时间(秒)
+    
+    # 预算与预估配置
+    MAX_RUN_TOKENS = None          # 单次运行token上限，None为不限制
+    MAX_RUN_REQUESTS = None        # 单次运行请求数上限，None为不限制
+    PLANNER_DEFAULT_LATENCY = 3.0  # 无历史数据时假定的单次请求延迟(秒)
+    PLANNER_MODIFY_RATIO = 0.5     # 无历史数据时假定的需要修改的比例
+    PLANNER_CHECK_OUTPUT_TOKENS = 80   # 校对响应的估算token数
+    PLANNER_MODIFY_OUTPUT_TOKENS = 60  # 修改响应中译文以外部分的估算token数
+    
+    # 抽样模式配置
+    SAMPLE_SIZE = 60               # 每个文件的抽样条数（按说话人和原文长度分层）
+    SAMPLE_SEED = None             # 随机种子，设为整数可复现抽样结果
+    SAMPLE_ESCALATE_ACCURACY = 90  # 估计准确率(%)低于该值的文件转为完整校对
+    SAMPLE_ESCALATE_SCORE = 80     # 估计平均分低于该值的文件转为完整校对
+    
+    # 推测性修改配置
+    SPECULATIVE_MODIFY = False              # 预测可能低分时，修改请求与校对并发发起
+    SPECULATIVE_LENGTH_RATIO = (0.8, 6.0)   # 译文/原文字符数比例超出该范围视为可能低分
+    
+    # 上下文窗口配置
+    CONTEXT_WINDOW_ENABLED = False  # 将连续的多行合并为一个窗口，一次请求完成校对评分
+    WINDOW_MAX_TOKENS = 1500        # 每个窗口原文/译文的token预算
+    WINDOW_MAX_LINES = 20           # 每个窗口的最大行数
+    
+    # 输出配置
+    REPORT_COMPACT = False   # 报告使用紧凑JSON（无缩进）
+    REPORT_GZIP = False      # 报告使用gzip压缩（写为 *.json.gz）
+    FAST_JSON = True         # 安装了orjson时使用orjson序列化
+    
+    # 翻译记忆配置（基于report/*_report.json中的历史结果）
+    TM_ENABLED = True             # 是否启用翻译记忆
+    TM_CONTEXT_THRESHOLD = 0.6    # 原文相似度达到该值时附加历史译文作为参考
+    TM_NGRAM_SIZE = 2             # 模糊匹配使用的字符n-gram长度
     
     # Prompt模板配置
     CHECK_PROMPT_TEMPLATE = """你是专业的翻译校对员，请评估以下翻译质量并返回JSON：
@@ -44,6 +91,29 @@ class Config:
 1. 准确性：是否准确传达原意
 2. 风格适配：是否符合目标风格要求
 3. 本地化：是否自然流畅
+4. 控制符：忽略@换页、\n换行、&选项隔断等控制符号"""
+    
+    WINDOW_CHECK_PROMPT_TEMPLATE = """你是专业的翻译校对员，以下是同一段对话中连续的若干行，请结合上下文逐行评估翻译质量并返回JSON：
+
+{lines}
+
+请按以下格式返回JSON结果，results中每一行对应一个元素，id为行首方括号中的序号：
+{{
+    "results": [
+        {{
+            "id": 0,
+            "score": 0-100的整数分数,
+            "is_correct": true/false,
+            "style_type": "网络梗|meme|游戏标准|普通翻译",
+            "comment": "简要评价翻译质量和风格适配度"
+        }}
+    ]
+}}
+
+评估要点：
+1. 准确性：结合上下文判断是否准确传达原意
+2. 风格适配：是否符合目标风格要求，说话人语气是否前后一致
+3. 本地化：是否自然流畅
 4. 控制符：忽略@换页、\n换行、&选项隔断等控制符号"""
     
     MODIFY_PROMPT_TEMPLATE = """你是资深翻译编辑，请根据以下要求修改英文翻译：
@@ -0,0 +1,65 @@
+import threading
+import time
+
+
+class Cancelled(RuntimeError):
+    """运行被取消（如Ctrl-C），停止派发新请求"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """超过截止时间"""
+
+
+class Deadline:
+    """
+    截止时间 + 协作式取消
+    子截止时间不会晚于父截止时间，并与父级共享取消信号
+    """
+
+    def __init__(self, timeout=None, parent=None, name="运行"):
+        self.name = name
+        self.parent = parent
+        self._cancel_event = parent._cancel_event if parent is not None else threading.Event()
+
+        expires_at = time.time() + timeout if timeout is not None else None
+        if parent is not None and parent.expires_at is not None:
+            expires_at = parent.expires_at if expires_at is None else min(expires_at, parent.expires_at)
+        self.expires_at = expires_at
+
+    def child(self, timeout=None, name=None):
+        """创建子截止时间（文件级/条目级）"""
+        return Deadline(timeout, parent=self, name=name or self.name)
+
+    def remaining(self):
+        """剩余秒数，无截止时间时返回None"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.time(), 0.0)
+
+    def expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def cancel(self):
+        """发出取消信号（对所有共享该信号的截止时间生效）"""
+        self._cancel_event.set()
+
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check(self):
+        """已取消或已超时则抛出异常"""
+        if self._cancel_event.is_set():
+            raise Cancelled("运行已取消")
+        if self.expired():
+            raise DeadlineExceeded(f"{self.name}超时")
+
+    def timeout_for(self, limit):
+        """在limit和剩余时间中取较小值，用作单次阻塞操作的超时"""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return remaining if limit is None else min(limit, remaining)
+
+    def sleep(self, seconds):
+        """可被取消打断的等待，不超过剩余时间"""
+        self._cancel_event.wait(self.timeout_for(seconds))
@@ -0,0 +1,197 @@
+import threading
+import time
+from config import Config
+
+# 熔断器状态
+CLOSED = "closed"        # 正常放行
+OPEN = "open"            # 已熔断，冷却中
+HALF_OPEN = "half_open"  # 冷却结束，放行单个探测请求
+
+# 请求结果：只有FAILURE计入熔断
+SUCCESS = "success"            # 请求成功
+FAILURE = "failure"            # 端点故障（5xx、连接错误、超时）
+RATE_LIMITED = "rate_limited"  # 429速率限制：端点暂停分配一段时间，不熔断
+REJECTED = "rejected"          # 其他4xx等与请求内容相关的错误，端点本身正常
+
+
+class Endpoint:
+    """单个API端点（地址 + 密钥 + 独立并发上限 + 熔断状态）"""
+
+    def __init__(self, base_url, api_key, model=None, max_concurrent=None, name=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model or Config.MODEL_NAME
+        self.max_concurrent = max_concurrent or Config.CONCURRENT_REQUESTS
+        self.name = name or self.base_url
+
+        self.state = CLOSED
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.backoff_until = 0.0
+
+        # 统计信息
+        self.total_requests = 0
+        self.success_count = 0
+        self.failure_count = 0
+        self.rate_limited_count = 0
+        self.rejected_count = 0
+        self.ejection_count = 0
+        self.total_latency = 0.0
+
+    def load(self):
+        """当前负载（按并发上限归一化的在途请求数）"""
+        return self.outstanding / self.max_concurrent
+
+    def stats(self):
+        """端点统计信息"""
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "state": self.state,
+            "total_requests": self.total_requests,
+            "success_count": self.success_count,
+            "failure_count": self.failure_count,
+            "rate_limited_count": self.rate_limited_count,
+            "rejected_count": self.rejected_count,
+            "ejection_count": self.ejection_count,
+            "average_latency": round(self.total_latency / self.success_count, 3) if self.success_count else 0
+        }
+
+
+class EndpointPool:
+    """
+    端点池：按最少在途请求分配端点
+    连续失败达到阈值的端点被熔断剔除，冷却后放行一个探测请求，成功则恢复
+    遇到速率限制的端点暂停分配rate_limit_backoff秒；熔断不会剔除最后一个可用端点
+    """
+
+    def __init__(self, endpoints, failure_threshold=3, cooldown=30.0, rate_limit_backoff=5.0):
+        if not endpoints:
+            raise ValueError("端点池至少需要一个端点")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.rate_limit_backoff = rate_limit_backoff
+        # 负载相同时从该位置开始轮询，避免流量总是落在第一个端点
+        self._next_index = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls):
+        """从配置构建端点池，未配置ENDPOINTS时使用BASE_URL/API_KEY"""
+        if Config.ENDPOINTS:
+            endpoints = [
+                Endpoint(
+                    base_url=ep["base_url"],
+                    api_key=ep["api_key"],
+                    model=ep.get("model"),
+                    max_concurrent=ep.get("max_concurrent"),
+                    name=ep.get("name")
+                )
+                for ep in Config.ENDPOINTS
+            ]
+        else:
+            endpoints = [Endpoint(Config.BASE_URL, Config.API_KEY)]
+        return cls(endpoints, Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_COOLDOWN, Config.RATE_LIMIT_BACKOFF)
+
+    def _is_available(self, endpoint, now):
+        """端点是否可接收新请求（必要时将冷却结束的端点转为半开）"""
+        if endpoint.state == OPEN:
+            if now - endpoint.opened_at < self.cooldown:
+                return False
+            endpoint.state = HALF_OPEN
+        if now < endpoint.backoff_until:
+            return False
+        if endpoint.state == HALF_OPEN:
+            # 半开状态只允许一个探测请求在途
+            return endpoint.outstanding == 0
+        return endpoint.outstanding < endpoint.max_concurrent
+
+    def _pick(self, now):
+        """选出负载最低的可用端点，负载相同时轮询；没有可用端点时返回None"""
+        count = len(self.endpoints)
+        best = None
+        for offset in range(count):
+            position = (self._next_index + offset) % count
+            endpoint = self.endpoints[position]
+            if self._is_available(endpoint, now) and (best is None or endpoint.load() < best[1].load()):
+                best = (position, endpoint)
+        if best is None:
+            return None
+        self._next_index = (best[0] + 1) % count
+        return best[1]
+
+    def _next_wakeup(self, now):
+        """没有可用端点时的等待时长"""
+        waits = [
+            self.cooldown - (now - ep.opened_at)
+            for ep in self.endpoints if ep.state == OPEN
+        ]
+        waits += [ep.backoff_until - now for ep in self.endpoints]
+        positive = [w for w in waits if w > 0]
+        return min(positive) if positive else None
+
+    def acquire(self, timeout=None):
+        """获取负载最低的可用端点，全部不可用时阻塞等待"""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                now = time.time()
+                endpoint = self._pick(now)
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    endpoint.total_requests += 1
+                    return endpoint
+
+                wait = self._next_wakeup(now)
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise TimeoutError("没有可用的API端点")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def _can_eject(self, endpoint):
+        """还有其他未熔断的端点时才允许熔断，避免整个池没有端点可用"""
+        return any(ep is not endpoint and ep.state != OPEN for ep in self.endpoints)
+
+    def release(self, endpoint, outcome, latency=0.0):
+        """归还端点并按请求结果更新熔断状态（outcome取SUCCESS/FAILURE/RATE_LIMITED/REJECTED）"""
+        with self._cond:
+            endpoint.outstanding -= 1
+            if outcome == FAILURE:
+                endpoint.failure_count += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.state == HALF_OPEN or (
+                    endpoint.state == CLOSED and endpoint.consecutive_failures >= self.failure_threshold
+                ):
+                    if self._can_eject(endpoint):
+                        endpoint.state = OPEN
+                        endpoint.opened_at = time.time()
+                        endpoint.ejection_count += 1
+                        print(f"⚠️ 端点 {endpoint.name} 连续失败，熔断 {self.cooldown} 秒")
+                    else:
+                        if endpoint.state == HALF_OPEN or endpoint.consecutive_failures == self.failure_threshold:
+                            print(f"⚠️ 端点 {endpoint.name} 连续失败，但已是最后一个可用端点，不熔断")
+                        endpoint.state = CLOSED
+            else:
+                # 端点有正常响应（包括限流和请求本身的错误），说明端点可用
+                if endpoint.state == HALF_OPEN:
+                    print(f"✅ 端点 {endpoint.name} 探测成功，恢复使用")
+                endpoint.state = CLOSED
+                endpoint.consecutive_failures = 0
+                if outcome == SUCCESS:
+                    endpoint.success_count += 1
+                    endpoint.total_latency += latency
+                elif outcome == RATE_LIMITED:
+                    endpoint.rate_limited_count += 1
+                    endpoint.backoff_until = max(endpoint.backoff_until, time.time() + self.rate_limit_backoff)
+                else:
+                    endpoint.rejected_count += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """所有端点的统计信息"""
+        with self._cond:
+            return [ep.stats() for ep in self.endpoints]
@@ -4,8 +4,17 @@ from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 from config import Config
-from utils import load_json, save_json, validate_structure, chunk_list, detect_text_field
-from proofreader import Proofreader
+from utils import save_json, load_file_pair
+from proofreader import Proofreader, SpeculationStats
+from api_client import AIClient
+from translation_memory import TranslationMemory
+from budget import RunBudget, BudgetExceeded
+from deadline import Deadline, Cancelled, DeadlineExceeded
+from planner import plan_run, print_plan
+from checkpoint import load_checkpoint, save_checkpoint, clear_checkpoint
+from sampling import sample_file, needs_full_run, make_rng
+from writer import OutputWriter
+from windowing import build_windows
 import json
 
 def generate_summary_report(reports):
@@ -29,6 +38,10 @@ def generate_summary_report(reports):
             issue_type = issue.get('type', '未知')
             issue_types[issue_type] = issue_types.get(issue_type, 0) + 1
 
+    # 统计翻译记忆命中
+    tm_reused = sum(1 for r in reports if r.get('tm_match', {}).get('reused'))
+    tm_referenced = sum(1 for r in reports if 'tm_match' in r) - tm_reused
+
     summary = {
         "summary": {
             "total_items": total_items,
@@ -37,7 +50,11 @@ def generate_summary_report(reports):
             "accuracy_rate": round(correct_items / total_items * 100, 2) if total_items > 0 else 0,
             "average_score": round(avg_score, 2),
             "issue_statistics": issue_types,
-            "modification_statistics": modification_levels
+            "modification_statistics": modification_levels,
+            "tm_statistics": {
+                "reused": tm_reused,
+                "referenced": tm_referenced
+            }
         },
         "detailed_reports": reports
     }
@@ -101,109 +118,126 @@ def select_files_interactive(file_pairs):
         print("❌ 输入格式错误，请输入数字或'all'")
         return []
 
-def process_file_pair(en_file, zh_file, proofreader):
-    """处理单个文件对"""
+def process_file_pair(en_file, zh_file, proofreader, done_reports=None, deadline=None):
+    """
+    处理单个文件对
+    done_reports: 断点中已完成的 {original_index: report}
+    deadline: 运行级截止时间，文件另有 FILE_PROCESSING_TIMEOUT 的截止时间；超时或取消时提前停止
+    """
     print(f"\n🔄 正在处理文件对: {os.path.basename(en_file)} <-> {os.path.basename(zh_file)}")
     
     try:
-        src = load_json(zh_file)
-        tgt = load_json(en_file)
-        # 保存原始翻译数据用于后续修改
-        original_tgt = load_json(en_file)
+        # 一次遍历完成加载、结构校验和文本提取
+        table = load_file_pair(zh_file, en_file)
     except FileNotFoundError as e:
         print(f"❌ 文件未找到: {e}")
         return None
     except json.JSONDecodeError as e:
         print(f"❌ JSON格式错误: {e}")
         return None
-
-    print(f"📄 中文条数: {len(src)}")
-    print(f"📄 英文条数: {len(tgt)}")
-
-    try:
-        validate_structure(src, tgt)
     except (ValueError, KeyError) as e:
         print(f"❌ 数据结构验证失败: {e}")
         return None
 
-    print("🔄 正在逐条处理数据...")
+    print(f"📄 条目数: {table.total_entries}，待校对: {len(table)}")
+    file_deadline = (deadline or Deadline()).child(
+        Config.FILE_PROCESSING_TIMEOUT, name=f"文件 {os.path.basename(en_file)} "
+    )
+
     all_reports = []
     processed_count = 0
+    resumed_count = 0
+    stopped = False
+    done_reports = done_reports or {}
     
-    # 逐条处理每一对数据
-    for i, (s, t) in enumerate(zip(src, tgt)):
-        source_field = detect_text_field(s)
-        target_field = detect_text_field(t)
-        
-        if not source_field or not target_field:
-            print(f"⚠ 第{i}条字段异常，跳过")
-            continue
-            
-        # 安全地获取和处理文本内容
+    # 断点中已完成且内容未变的条目直接沿用
+    pending = []
+    for item in table.items():
+        done = done_reports.get(item.index)
+        if done and done.get('source_text') == item.source and done.get('target_text') == item.target:
+            all_reports.append(done)
+            resumed_count += 1
+        else:
+            pending.append(item)
+    
+    # 上下文窗口模式按场景分组，否则逐条处理
+    if Config.CONTEXT_WINDOW_ENABLED:
+        units = build_windows(pending, Config.WINDOW_MAX_TOKENS, Config.WINDOW_MAX_LINES)
+        print(f"🔄 正在按上下文窗口处理数据（{len(pending)} 条分为 {len(units)} 个窗口）...")
+    else:
+        units = [[item] for item in pending]
+        print("🔄 正在逐条处理数据...")
+    
+    for unit in units:
+        first, last = unit[0].index, unit[-1].index
+        label = f"第{first}条" if first == last else f"第{first}-{last}条"
+        # 对单条数据/窗口进行AI校对
         try:
-            source_value = s[source_field]
-            target_value = t[target_field]
-            
-            # 确保转换为字符串并去除空白
-            source_text = str(source_value).strip() if source_value is not None else ""
-            target_text = str(target_value).strip() if target_value is not None else ""
-            
-            # 验证文本不为空
-            if not source_text or not target_text:
-                print(f"⚠ 第{i}条文本内容为空，跳过")
-                continue
-                
-            # 创建单条数据进行处理
-            single_item = [{
-                "index": i,
-                "name": s.get("name"),
-                "source": source_text,
-                "target": target_text
-            }]
-            
-            # 对单条数据进行AI校对
-            try:
-                reports = proofreader.proofread_batch(single_item)
-                all_reports.extend(reports)
-                processed_count += 1
-                print(f"✅ 第{i}条处理完成")
-            except Exception as e:
-                print(f"❌ 第{i}条处理失败: {e}")
-                # 为失败的条目创建错误报告
+            file_deadline.check()
+            if Config.CONTEXT_WINDOW_ENABLED:
+                reports = proofreader.proofread_window(unit, file_deadline)
+            else:
+                reports = proofreader.proofread_batch(unit, file_deadline)
+            all_reports.extend(reports)
+            processed_count += len(unit)
+            print(f"✅ {label}处理完成")
+        except BudgetExceeded as e:
+            print(f"⏹️ 预算用尽，停止派发: {e}")
+            stopped = True
+            break
+        except Cancelled:
+            print("⏹️ 运行已取消，停止派发")
+            stopped = True
+            break
+        except DeadlineExceeded as e:
+            print(f"⏱️ {e}，停止处理该文件")
+            stopped = True
+            break
+        except KeyboardInterrupt:
+            # 串行模式下中断信号落在主线程，取消后保留已完成的结果
+            print("\n⏹️ 收到中断信号，停止派发")
+            file_deadline.cancel()
+            stopped = True
+            break
+        except Exception as e:
+            print(f"❌ {label}处理失败: {e}")
+            # 为失败的条目创建错误报告
+            for item in unit:
                 all_reports.append({
-                    "original_index": i,
-                    "name": s.get("name"),
-                    "source_text": source_text,
-                    "target_text": target_text,
+                    "original_index": item.index,
+                    "name": item.name,
+                    "source_text": item.source,
+                    "target_text": item.target,
                     "score": 0,
-                    "modified_text": target_text,
+                    "modified_text": item.target,
                     "comment": f"单条处理失败: {str(e)}",
                     "is_correct": False,
                     "error": str(e)
                 })
-                
-        except Exception as e:
-            print(f"⚠ 第{i}条数据处理出错: {e}")
-            continue
+    all_reports.sort(key=lambda r: r['original_index'])
 
     if not all_reports:
         print("❌ 没有成功处理任何数据")
         return None
 
-    print(f"✅ 处理完成，共处理 {processed_count} 条数据")
+    if resumed_count:
+        print(f"♻️ 从断点恢复 {resumed_count} 条")
+    if stopped:
+        print(f"⏹️ 已处理 {processed_count} 条，剩余条目留待下次运行")
+    else:
+        print(f"✅ 处理完成，共处理 {processed_count} 条数据")
     
     return {
-        'src_data': src,
-        'tgt_data': tgt,
-        'original_tgt': original_tgt,
+        'table': table,
         'reports': all_reports,
-        'filename': os.path.basename(en_file)
+        'filename': os.path.basename(en_file),
+        'stopped': stopped
     }
 
-def process_file_pair_parallel(pair, proofreader):
+def process_file_pair_parallel(pair, proofreader, done_reports=None, deadline=None):
     """并行处理单个文件对的包装函数"""
     try:
-        result = process_file_pair(pair['en_file'], pair['zh_file'], proofreader)
+        result = process_file_pair(pair['en_file'], pair['zh_file'], proofreader, done_reports, deadline)
         if result:
             result['base_name'] = pair['base_name']
         return result
@@ -211,48 +245,169 @@ def process_file_pair_parallel(pair, proofreader):
         print(f"❌ 文件 {pair['base_name']} 处理异常: {e}")
         return None
 
-def process_files_concurrently(selected_pairs):
+def report_write_options():
+    """报告文件的写出选项（紧凑/压缩/快速序列化）"""
+    return {"compact": Config.REPORT_COMPACT, "compress": Config.REPORT_GZIP, "fast": Config.FAST_JSON}
+
+def write_file_outputs(result, writer, modified_folder, report_folder):
+    """文件处理完成后立即应用修改，并把修改后的文件和单独报告交给后台写出线程"""
+    reports = result['reports']
+    # 交给写出线程后不再需要保留列式数据
+    table = result.pop('table')
+    filename = result['filename']
+    base_name = result['base_name']
+    
+    # 创建修改后的英文文件副本
+    modified_count = 0
+    for report in reports:
+        original_index = report['original_index']
+        if report['target_text'] != report['modified_text']:
+            # 更新翻译文件中的对应条目（字段名已在加载时解析）
+            table.set_target_text(original_index, report['modified_text'])
+            modified_count += 1
+    result['modified_count'] = modified_count
+    
+    # 保存修改后的翻译文件到output/en_modified/（保持原有缩进格式）
+    writer.submit(table.tgt_data, os.path.join(modified_folder, filename), fast=Config.FAST_JSON)
+    
+    # 为该文件生成单独的报告
+    file_report = {
+        "file_info": {
+            "filename": filename,
+            "base_name": base_name,
+            "total_items": len(reports),
+            "modified_items": modified_count
+        },
+        "reports": reports
+    }
+    writer.submit(file_report, os.path.join(report_folder, f"{base_name}_report.json"), **report_write_options())
+    
+    print(f"📁 {filename}: 修改了 {modified_count} 条")
+
+def process_files_concurrently(selected_pairs, translation_memory=None, ai_client=None, checkpoint=None,
+                               speculation_stats=None, on_result=None, deadline=None, speculation_executor=None):
     """多文件并行处理主函数"""
     print(f"🔄 启动多文件并行处理，最大并发数: {Config.CONCURRENT_FILES}")
     
-    # 为每个文件创建独立的Proofreader实例
+    # 为每个文件创建独立的Proofreader实例（共享同一个端点池和推测性修改线程池）
     all_results = []
     completed_count = 0
     
-    with ThreadPoolExecutor(max_workers=Config.CONCURRENT_FILES) as executor:
+    executor = ThreadPoolExecutor(max_workers=Config.CONCURRENT_FILES)
+    interrupted = False
+    try:
         # 提交所有文件处理任务
         future_to_pair = {
-            executor.submit(process_file_pair_parallel, pair, Proofreader()): pair 
+            executor.submit(
+                process_file_pair_parallel, pair,
+                Proofreader(translation_memory, ai_client, speculation_stats, speculation_executor),
+                (checkpoint or {}).get(pair['base_name']), deadline
+            ): pair 
             for pair in selected_pairs
         }
         
         # 轮询获取结果
         completed_futures = set()
         while len(completed_futures) < len(future_to_pair):
-            for future in future_to_pair:
-                if future not in completed_futures and future.done():
+            try:
+                for future in future_to_pair:
+                    if future in completed_futures or not future.done():
+                        continue
+                    # 先标记为已收集：中断落在on_result中时，下一轮不会重复收集同一结果
+                    completed_futures.add(future)
+                    pair = future_to_pair[future]
                     try:
-                        result = future.result(timeout=Config.FILE_PROCESSING_TIMEOUT)
+                        result = future.result()
                         if result:
+                            if on_result:
+                                on_result(result)
+                            # on_result成功后才计入结果（写出时会补充modified_count）
                             all_results.append(result)
                             completed_count += 1
                             print(f"✅ 文件 {result['base_name']} 处理完成")
-                        else:
-                            pair = future_to_pair[future]
+                        elif not future.cancelled():
                             print(f"❌ 文件 {pair['base_name']} 处理失败")
-                        completed_futures.add(future)
                     except Exception as e:
-                        pair = future_to_pair[future]
-                        print(f"❌ 文件 {pair['base_name']} 处理超时或出错: {e}")
-                        completed_futures.add(future)
-            
-            # 如果还有未完成的任务，短暂休眠
-            if len(completed_futures) < len(future_to_pair):
-                time.sleep(1)
+                        if not future.cancelled():
+                            print(f"❌ 文件 {pair['base_name']} 处理超时或出错: {e}")
+                
+                # 如果还有未完成的任务，短暂休眠
+                if len(completed_futures) < len(future_to_pair):
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                # 第二次中断或没有截止时间对象时不再等待，直接退出
+                if deadline is None or deadline.cancelled():
+                    interrupted = True
+                    raise
+                print("\n⏹️ 收到中断信号，正在取消剩余任务，已完成的结果将保存到断点（再按一次立即退出）...")
+                deadline.cancel()
+                # 尚未开始的文件直接取消，进行中的文件会在下一次检查时停止
+                for future in future_to_pair:
+                    future.cancel()
+    finally:
+        # 强制退出时不等待仍在进行中的文件线程
+        executor.shutdown(wait=not interrupted, cancel_futures=interrupted)
     
     print(f"🎯 并行处理完成: {completed_count}/{len(selected_pairs)} 个文件成功处理")
     return all_results
 
+def sample_files(selected_pairs, proofreader, deadline=None):
+    """抽样模式：对每个文件分层抽样评估，返回(抽样汇总, 需要完整校对的文件对)"""
+    rng = make_rng()
+    files = {}
+    escalated = []
+    unevaluated = []
+    stopped = False
+    for pair in selected_pairs:
+        if stopped or (deadline is not None and (deadline.cancelled() or deadline.expired())):
+            # 预算用尽、超时或已取消：其余文件既未评估也未转为完整校对
+            stopped = True
+            unevaluated.append(pair['base_name'])
+            continue
+        try:
+            table = load_file_pair(pair['zh_file'], pair['en_file'], verbose=False)
+        except Exception as e:
+            print(f"❌ 文件 {pair['base_name']} 加载失败: {e}")
+            continue
+
+        print(f"\n🎲 正在抽样: {pair['base_name']} ({len(table)} 条中抽取 {min(Config.SAMPLE_SIZE, len(table))} 条)")
+        result = sample_file(table, proofreader, Config.SAMPLE_SIZE, rng, deadline)
+        result['escalated'] = needs_full_run(result)
+        files[pair['base_name']] = result
+
+        estimate = result['estimate']
+        if estimate:
+            print(f"📈 估计准确率: {estimate['accuracy_rate']}% "
+                  f"(95%置信区间 {estimate['accuracy_ci'][0]}~{estimate['accuracy_ci'][1]})")
+            print(f"⭐ 估计平均分: {estimate['average_score']} "
+                  f"(95%置信区间 {estimate['average_score_ci'][0]}~{estimate['average_score_ci'][1]})")
+            if estimate['unsampled_share'] > 0:
+                print(f"⚠ {estimate['unsampled_share']:.0%} 的条目所在分层没有有效样本，置信区间已按其可能取值放宽")
+        else:
+            print("⚠ 没有有效的抽样结果，无法估计")
+        if result['stopped']:
+            print("⏹️ 预算用尽、超时或运行已取消，抽样未完成")
+            result['escalated'] = False
+            stopped = True
+            unevaluated.append(pair['base_name'])
+            continue
+        if result['escalated']:
+            print(f"🔎 低于阈值，转为完整校对")
+            escalated.append(pair)
+        else:
+            print(f"✅ 质量达标，无需完整校对")
+
+    sampling_summary = {
+        "confidence_level": 0.95,
+        "sample_size": Config.SAMPLE_SIZE,
+        "escalate_accuracy": Config.SAMPLE_ESCALATE_ACCURACY,
+        "escalate_score": Config.SAMPLE_ESCALATE_SCORE,
+        "stopped": stopped,
+        "unevaluated": unevaluated,
+        "files": files
+    }
+    return sampling_summary, escalated
+
 def run():
     print("🔄 正在扫描输入文件夹...")
     
@@ -289,6 +444,47 @@ def run():
     
     print(f"\n✅ 已选择 {len(selected_pairs)} 个文件对进行处理")
     
+    # 从历史报告构建翻译记忆（需在本次报告覆盖前加载）
+    translation_memory = None
+    if Config.TM_ENABLED:
+        translation_memory = TranslationMemory.load_or_build(REPORT_FOLDER, ngram_size=Config.TM_NGRAM_SIZE)
+        print(f"📚 翻译记忆已加载: {len(translation_memory)} 条审定记录")
+    
+    # 所有文件共享一个AI客户端，请求在端点池内负载均衡，并共同受运行预算约束
+    budget = RunBudget(Config.MAX_RUN_TOKENS, Config.MAX_RUN_REQUESTS)
+    ai_client = AIClient(budget=budget)
+    if len(ai_client.pool.endpoints) > 1:
+        print(f"🌐 已配置 {len(ai_client.pool.endpoints)} 个API端点")
+    # 各文件的Proofreader共享推测性修改统计
+    speculation_stats = SpeculationStats()
+    
+    # 询问是否先抽样评估，只对不达标的文件做完整校对
+    sampling_summary = None
+    print(f"\n💡 运行模式:")
+    print(f"   完整校对: 逐条校对并修改")
+    print(f"   抽样评估: 每个文件分层抽取 {Config.SAMPLE_SIZE} 条只做评分，不达标的文件再完整校对")
+    if input("请选择运行模式 (full/sample): ").strip().lower() == 'sample':
+        # 抽样阶段的截止时间从派发请求时开始计时，等待用户输入的时间不计入
+        sampling_deadline = Deadline(Config.RUN_TIMEOUT, name="抽样")
+        sampling_summary, selected_pairs = sample_files(
+            selected_pairs, Proofreader(translation_memory, ai_client), sampling_deadline
+        )
+        if not selected_pairs or sampling_summary['stopped']:
+            summary_path = save_json(
+                {"sampling": sampling_summary},
+                os.path.join(REPORT_FOLDER, "summary_report.json"),
+                **report_write_options()
+            )
+            if sampling_summary['stopped']:
+                print(f"\n⏹️ 抽样未完成（预算用尽、超时或已取消），已完成的抽样结果已保存: {summary_path}")
+                print(f"   未评估的文件: {', '.join(sampling_summary['unevaluated'])}")
+                if selected_pairs:
+                    print(f"   需要完整校对的文件: {', '.join(p['base_name'] for p in selected_pairs)}")
+            else:
+                print(f"\n✅ 抽样评估完成，没有需要完整校对的文件，结果已保存: {summary_path}")
+            return
+        print(f"\n🔎 {len(selected_pairs)} 个文件需要完整校对")
+    
     # 询问用户是否使用并行处理
     if len(selected_pairs) > 1:
         print(f"\n💡 检测到多个文件，可选择并行处理提高效率")
@@ -300,79 +496,103 @@ def run():
         use_parallel = False
         print("\n💡 单个文件，使用串行处理")
     
-    if use_parallel:
-        # 使用并行处理
-        all_results = process_files_concurrently(selected_pairs)
-    else:
-        # 使用串行处理
-        proofreader = Proofreader()
-        all_results = []
-        
-        # 处理每个选中的文件对
-        for pair in selected_pairs:
-            result = process_file_pair(pair['en_file'], pair['zh_file'], proofreader)
-            if result:
-                # 添加文件名信息用于报告命名
-                result['base_name'] = pair['base_name']
-                all_results.append(result)
-    
-    if not all_results:
-        print("❌ 没有成功处理任何文件")
+    # 读取断点，跳过上次已完成的条目
+    checkpoint = load_checkpoint(REPORT_FOLDER)
+    resumable = [p['base_name'] for p in selected_pairs if p['base_name'] in checkpoint]
+    if resumable:
+        print(f"\n♻️ 发现断点，将跳过以下文件中已完成的条目: {', '.join(resumable)}")
+    
+    # 运行前预估请求数、token和耗时
+    plan = plan_run(selected_pairs, translation_memory, ai_client, REPORT_FOLDER, use_parallel, checkpoint)
+    print_plan(plan)
+    if input("\n是否开始处理? (y/n): ").strip().lower() not in ('y', 'yes'):
+        print("❌ 已取消")
         return
-
-    # 处理所有结果并生成报告
-    total_modified = 0
-    all_detailed_reports = []
-    
-    # 为每个文件生成单独的报告并在output中创建修改后的副本
-    for result in all_results:
-        reports = result['reports']
-        original_tgt = result['original_tgt']
-        filename = result['filename']
-        base_name = result['base_name']
-        
-        # 创建修改后的英文文件副本
-        modified_count = 0
-        for report in reports:
-            original_index = report['original_index']
-            if report['target_text'] != report['modified_text']:
-                # 更新翻译文件中的对应条目
-                target_field = detect_text_field(original_tgt[original_index])
-                if target_field:
-                    original_tgt[original_index][target_field] = report['modified_text']
-                    modified_count += 1
-        
-        # 保存修改后的翻译文件到output/en_modified/
-        modified_filename = filename
-        save_json(original_tgt, os.path.join(MODIFIED_FOLDER, modified_filename))
-        total_modified += modified_count
-        
-        # 为该文件生成单独的报告
-        file_report = {
-            "file_info": {
-                "filename": filename,
-                "base_name": base_name,
-                "total_items": len(reports),
-                "modified_items": modified_count
-            },
-            "reports": reports
-        }
-        
-        # 保存单独的报告文件
-        report_filename = f"{base_name}_report.json"
-        save_json(file_report, os.path.join(REPORT_FOLDER, report_filename))
+    
+    # 运行级截止时间在确认开始后才计时（选择、预估和确认的时间不计入）
+    # 文件级和条目级截止时间都从它派生，Ctrl-C时统一取消
+    run_deadline = Deadline(Config.RUN_TIMEOUT, name="运行")
+    
+    # 每个文件完成后立即由后台线程写出，与其余文件的API请求重叠
+    writer = OutputWriter()
+    on_result = lambda result: write_file_outputs(result, writer, MODIFIED_FOLDER, REPORT_FOLDER)
+    # 推测性修改请求由所有文件共享的线程池发出，运行结束时关闭
+    speculation_executor = None
+    if Config.SPECULATIVE_MODIFY:
+        speculation_executor = ThreadPoolExecutor(
+            max_workers=Config.CONCURRENT_FILES * Config.CONCURRENT_REQUESTS,
+            thread_name_prefix="speculative-modify"
+        )
+    try:
+        if use_parallel:
+            # 使用并行处理
+            all_results = process_files_concurrently(
+                selected_pairs, translation_memory, ai_client, checkpoint, speculation_stats, on_result, run_deadline,
+                speculation_executor=speculation_executor
+            )
+        else:
+            # 使用串行处理
+            proofreader = Proofreader(translation_memory, ai_client, speculation_stats, speculation_executor)
+            all_results = []
+            
+            # 处理每个选中的文件对
+            for pair in selected_pairs:
+                if budget.exhausted or run_deadline.cancelled() or run_deadline.expired():
+                    print(f"⏹️ 运行已停止，跳过文件 {pair['base_name']}")
+                    continue
+                result = process_file_pair(
+                    pair['en_file'], pair['zh_file'], proofreader, checkpoint.get(pair['base_name']), run_deadline
+                )
+                if result:
+                    # 添加文件名信息用于报告命名
+                    result['base_name'] = pair['base_name']
+                    on_result(result)
+                    all_results.append(result)
         
-        # 添加到总报告
-        all_detailed_reports.extend(reports)
+        if not all_results:
+            print("❌ 没有成功处理任何文件")
+            return
+
+        # 汇总各文件结果
+        total_modified = sum(result['modified_count'] for result in all_results)
+        all_detailed_reports = []
+        for result in all_results:
+            all_detailed_reports.extend(result['reports'])
         
-        print(f"📁 {filename}: 修改了 {modified_count} 条")
+        # 生成总汇总报告
+        summary_report = generate_summary_report(all_detailed_reports)
+        summary_report['summary']['endpoint_statistics'] = ai_client.pool.stats()
+        summary_report['summary']['budget_statistics'] = budget.stats()
+        if Config.SPECULATIVE_MODIFY:
+            summary_report['summary']['speculation_statistics'] = speculation_stats.stats()
+        if sampling_summary is not None:
+            summary_report['sampling'] = sampling_summary
     
-    # 生成总汇总报告
-    summary_report = generate_summary_report(all_detailed_reports)
+        # 保存总报告
+        total_report_path = os.path.join(REPORT_FOLDER, "summary_report.json")
+        writer.submit(summary_report, total_report_path, **report_write_options())
+        if Config.REPORT_GZIP:
+            total_report_path += ".gz"
+    finally:
+        if speculation_executor is not None:
+            speculation_executor.shutdown(wait=False, cancel_futures=True)
+        # 等待所有写出任务完成
+        write_errors = writer.close()
+    if write_errors:
+        print(f"❌ {len(write_errors)} 个文件写出失败")
     
-    # 保存总报告
-    total_report_path = os.path.join(REPORT_FOLDER, "summary_report.json")
-    save_json(summary_report, total_report_path)
+    # 读入本次写出的报告并保存翻译记忆索引，下次启动无需重建
+    if translation_memory is not None:
+        translation_memory.refresh(REPORT_FOLDER)
+        translation_memory.save(REPORT_FOLDER)
+
+    # 预算用尽、超时或取消时保存断点，否则清除已完成文件的断点
+    run_stopped = budget.exhausted or run_deadline.cancelled() or run_deadline.expired()
+    if run_stopped or any(r.get('stopped') for r in all_results):
+        checkpoint_file = save_checkpoint(REPORT_FOLDER, all_results)
+        print(f"⏹️ 运行提前停止，断点已保存: {checkpoint_file}")
+    else:
+        clear_checkpoint(REPORT_FOLDER, [r['base_name'] for r in all_results])
 
     print("====================================")
     print("✅ 校对完成")
@@ -382,6 +602,17 @@ def run():
     print(f"📈 准确率: {summary_report['summary']['accuracy_rate']}%")
     print(f"⭐ 平均分: {summary_report['summary']['average_score']}")
     print(f"✏️  总共修改条目: {total_modified}条")
+    print(f"📨 请求数: {budget.used_requests} | 🔤 token: {budget.used_tokens}")
+    if Config.SPECULATIVE_MODIFY:
+        spec = summary_report['summary']['speculation_statistics']
+        print(f"🔮 推测修改: 发起 {spec['predicted']} | 命中 {spec['hits']} ({spec['hit_rate']}%) | "
+              f"浪费 {spec['wasted']} ({spec['waste_rate']}%) | 取消 {spec['cancelled']} | 漏判 {spec['missed']}")
+    
+    print(f"\n🌐 端点统计:")
+    for ep in summary_report['summary']['endpoint_statistics']:
+        print(f"  {ep['name']}: 请求 {ep['total_requests']} | 成功 {ep['success_count']} | "
+              f"失败 {ep['failure_count']} | 限流 {ep['rate_limited_count']} | 熔断 {ep['ejection_count']}次 | "
+              f"平均延迟 {ep['average_latency']}s")
     
     print(f"\n📂 输出位置:")
     print(f"  修改后的文件: {MODIFIED_FOLDER}")
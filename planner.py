@@ -0,0 +1,191 @@
+import math
+import os
+from config import Config
+from budget import estimate_tokens
+from translation_memory import mask_numbers
+from utils import load_json, load_file_pair, resolve_json_path
+from windowing import build_windows, line_tokens
+
+# 模板本身的token开销（去掉原文/译文后的部分）
+CHECK_TEMPLATE_TOKENS = estimate_tokens(Config.CHECK_PROMPT_TEMPLATE.format(source_text="", target_text=""))
+MODIFY_TEMPLATE_TOKENS = estimate_tokens(Config.MODIFY_PROMPT_TEMPLATE.format(source_text="", target_text=""))
+WINDOW_TEMPLATE_TOKENS = estimate_tokens(Config.WINDOW_CHECK_PROMPT_TEMPLATE.format(lines=""))
+# 窗口模式下每行返回结果的估算token数
+WINDOW_RESULT_TOKENS = 50
+
+
+def load_history(report_folder):
+    """从上次的总报告中读取实测的修改比例和平均延迟，没有则返回配置的默认值"""
+    modify_ratio = Config.PLANNER_MODIFY_RATIO
+    latency = Config.PLANNER_DEFAULT_LATENCY
+    source = "默认配置"
+
+    path = resolve_json_path(os.path.join(report_folder, "summary_report.json"))
+    if path is None:
+        return modify_ratio, latency, source
+    try:
+        summary = load_json(path)
+    except Exception:
+        return modify_ratio, latency, source
+
+    # 翻译记忆复用的条目没有调用AI，不计入比例
+    checked = [r for r in summary.get('detailed_reports', []) if not r.get('tm_match', {}).get('reused')]
+    if checked:
+        modify_ratio = sum(1 for r in checked if r.get('score', 0) < 85) / len(checked)
+        source = "上次运行"
+
+    endpoints = summary.get('summary', {}).get('endpoint_statistics', [])
+    successes = sum(ep.get('success_count', 0) for ep in endpoints)
+    if successes:
+        latency = sum(ep.get('average_latency', 0) * ep.get('success_count', 0) for ep in endpoints) / successes
+        source = "上次运行"
+
+    return modify_ratio, latency, source
+
+
+def plan_run(selected_pairs, translation_memory=None, ai_client=None, report_folder="report",
+             use_parallel=False, checkpoint=None):
+    """
+    预估本次运行的请求数、token数和耗时（不调用AI）
+    断点中已完成和翻译记忆可直接复用的条目视为已分流；
+    同一模板的重复行只计一次（运行时由翻译记忆即时复用）
+    """
+    checkpoint = checkpoint or {}
+    modify_ratio, latency, history_source = load_history(report_folder)
+
+    files = []
+    seen = set()
+    for pair in selected_pairs:
+        try:
+            table = load_file_pair(pair['zh_file'], pair['en_file'], verbose=False)
+        except Exception as e:
+            files.append({"base_name": pair['base_name'], "error": str(e)})
+            continue
+
+        done = checkpoint.get(pair['base_name'], {})
+        resumed = 0
+        tm_hits = 0
+        duplicates = 0
+        pending = []
+        for item in table.items():
+            if item.index in done:
+                resumed += 1
+                continue
+            if translation_memory is not None:
+                if translation_memory.find_reusable(item.source, item.target) is not None:
+                    tm_hits += 1
+                    continue
+                key = (mask_numbers(item.source)[0], mask_numbers(item.target)[0])
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+            pending.append(item)
+
+        prompt_tokens = 0
+        output_tokens = 0
+        for item in pending:
+            text_tokens = estimate_tokens(item.source) + estimate_tokens(item.target)
+            prompt_tokens += modify_ratio * (MODIFY_TEMPLATE_TOKENS + text_tokens)
+            output_tokens += modify_ratio * (Config.PLANNER_MODIFY_OUTPUT_TOKENS + estimate_tokens(item.target))
+
+        if Config.CONTEXT_WINDOW_ENABLED:
+            # 每个窗口一次校对请求，低分行再逐行修改
+            windows = build_windows(pending, Config.WINDOW_MAX_TOKENS, Config.WINDOW_MAX_LINES)
+            check_requests = len(windows)
+            prompt_tokens += len(windows) * WINDOW_TEMPLATE_TOKENS + sum(line_tokens(item) for item in pending)
+            output_tokens += len(pending) * WINDOW_RESULT_TOKENS
+        else:
+            check_requests = len(pending)
+            prompt_tokens += sum(CHECK_TEMPLATE_TOKENS + estimate_tokens(item.source) + estimate_tokens(item.target)
+                                 for item in pending)
+            output_tokens += len(pending) * Config.PLANNER_CHECK_OUTPUT_TOKENS
+
+        requests = check_requests + len(pending) * modify_ratio
+        files.append({
+            "base_name": pair['base_name'],
+            "total_entries": table.total_entries,
+            "skipped_entries": table.total_entries - len(table),
+            "resumed": resumed,
+            "tm_hits": tm_hits,
+            "duplicates": duplicates,
+            "requests": round(requests),
+            "prompt_tokens": round(prompt_tokens),
+            "output_tokens": round(output_tokens),
+            # 单个文件内逐条串行处理（每条先校对后修改）
+            "seconds": requests * latency
+        })
+
+    valid = [f for f in files if "error" not in f]
+    total_requests = sum(f['requests'] for f in valid)
+    total_tokens = sum(f['prompt_tokens'] + f['output_tokens'] for f in valid)
+    serial_seconds = sum(f['seconds'] for f in valid)
+    longest_file = max((f['seconds'] for f in valid), default=0)
+
+    endpoints = ai_client.pool.endpoints if ai_client else []
+    capacity = sum(ep.max_concurrent for ep in endpoints) if endpoints else Config.CONCURRENT_REQUESTS
+    # 单个文件内逐条串行，同时在途的请求数约等于并发文件数，超过端点总并发上限的文件只能排队；
+    # 总耗时不低于最大文件耗时，并发文件数超过 总耗时/最大文件耗时 后不再缩短整体耗时
+    useful_files = min(len(valid), math.ceil(serial_seconds / longest_file)) if longest_file else 1
+    recommended_files = max(1, min(useful_files, capacity))
+    # 端点总并发不足以支撑可并行的文件数时，建议的单端点并发上限
+    recommended_requests = math.ceil(useful_files / max(len(endpoints), 1)) if useful_files > capacity else None
+    if use_parallel:
+        concurrency = max(1, min(Config.CONCURRENT_FILES, len(valid), capacity))
+        wall_seconds = max(serial_seconds / concurrency, longest_file)
+    else:
+        concurrency = 1
+        wall_seconds = serial_seconds
+
+    return {
+        "files": files,
+        "modify_ratio": modify_ratio,
+        "latency": latency,
+        "history_source": history_source,
+        "total_requests": total_requests,
+        "total_prompt_tokens": sum(f['prompt_tokens'] for f in valid),
+        "total_output_tokens": sum(f['output_tokens'] for f in valid),
+        "total_tokens": total_tokens,
+        "concurrency": concurrency,
+        "wall_seconds": wall_seconds,
+        "longest_file_seconds": longest_file,
+        "recommended_concurrent_files": recommended_files,
+        "recommended_wall_seconds": max(serial_seconds / recommended_files, longest_file),
+        "recommended_concurrent_requests": recommended_requests,
+        "endpoint_capacity": capacity
+    }
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}小时{minutes}分{seconds}秒" if hours else f"{minutes}分{seconds}秒"
+
+
+def print_plan(plan):
+    """打印运行预估"""
+    print("\n📐 运行预估:")
+    for f in plan['files']:
+        if "error" in f:
+            print(f"  ❌ {f['base_name']}: 无法加载 ({f['error']})")
+            continue
+        print(f"  {f['base_name']}: {f['total_entries']}条 | 跳过空行 {f['skipped_entries']} | "
+              f"断点已完成 {f['resumed']} | 记忆复用 {f['tm_hits']} | 重复 {f['duplicates']} | 约 {f['requests']} 次请求")
+    print(f"  修改比例 {plan['modify_ratio']:.0%}，单次延迟 {plan['latency']:.1f}s（来源: {plan['history_source']}）")
+    print(f"  📨 预计请求数: {plan['total_requests']}")
+    print(f"  🔤 预计token: {plan['total_tokens']} (输入 {plan['total_prompt_tokens']} / 输出 {plan['total_output_tokens']})")
+    print(f"  ⏱️  预计耗时: {_format_seconds(plan['wall_seconds'])}（文件并发 {plan['concurrency']}）")
+
+    if plan['concurrency'] < plan['recommended_concurrent_files']:
+        print(f"  💡 建议使用并行处理，CONCURRENT_FILES 设为 {plan['recommended_concurrent_files']}，"
+              f"预计耗时可降至 {_format_seconds(plan['recommended_wall_seconds'])}")
+    if plan['recommended_concurrent_requests']:
+        print(f"  💡 端点总并发上限 {plan['endpoint_capacity']} 不足，如API限额允许，"
+              f"可将 CONCURRENT_REQUESTS（或端点的 max_concurrent）提高到 {plan['recommended_concurrent_requests']}")
+    if plan['longest_file_seconds'] > plan['wall_seconds'] * 0.8 and len(plan['files']) > 1:
+        print(f"  💡 最大文件耗时约 {_format_seconds(plan['longest_file_seconds'])}，是整体耗时的瓶颈")
+
+    if Config.MAX_RUN_REQUESTS is not None and plan['total_requests'] > Config.MAX_RUN_REQUESTS:
+        print(f"  ⚠️ 预计请求数超过预算 MAX_RUN_REQUESTS={Config.MAX_RUN_REQUESTS}，运行将提前停止并保存断点")
+    if Config.MAX_RUN_TOKENS is not None and plan['total_tokens'] > Config.MAX_RUN_TOKENS:
+        print(f"  ⚠️ 预计token超过预算 MAX_RUN_TOKENS={Config.MAX_RUN_TOKENS}，运行将提前停止并保存断点")
@@ -1,29 +1,124 @@
 from api_client import AIClient
+from budget import BudgetExceeded
+from deadline import Deadline, Cancelled
 from config import Config
+from utils import intern_str
+from windowing import format_window_lines
 import json
+import math
 import re
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-class Proofreader:
+# 预算用尽或运行取消时停止派发，这两类异常不转为错误报告
+STOP_DISPATCH = (BudgetExceeded, Cancelled)
+
+CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]')
+# 控制符：@换页、\n换行（字面或实际换行）、&选项隔断
+CONTROL_CODES = ("@", "\\n", "\n", "&")
+
+def predict_low_score(source_text, target_text):
+    """本地廉价预测译文是否可能低分（用于提前发起推测性修改）"""
+    # 译文中残留未翻译的中文
+    if CJK_PATTERN.search(target_text):
+        return True
+    # 控制符数量不一致
+    for code in CONTROL_CODES:
+        if source_text.count(code) != target_text.count(code):
+            return True
+    # 长度比例异常（英文字符数相对中文原文过短或过长）
+    min_ratio, max_ratio = Config.SPECULATIVE_LENGTH_RATIO
+    ratio = len(target_text) / max(len(source_text), 1)
+    return not (min_ratio <= ratio <= max_ratio)
+
+def coerce_score(value):
+    """把AI返回的评分转为数值（接受"90"这样的数字字符串），缺失或无法转换时返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value.strip())
+        except ValueError:
+            return None
+        if value.is_integer():
+            value = int(value)
+    if not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return value
+
+class SpeculationStats:
+    """推测性修改的命中/浪费统计（可在多个Proofreader间共享）"""
+
     def __init__(self):
-        self.ai = AIClient()
+        self.predicted = 0   # 预测低分并提前发起修改
+        self.hits = 0        # 校对确实低分，推测结果被采用
+        self.cancelled = 0   # 校对达标，修改请求尚未发出即被取消
+        self.wasted = 0      # 校对达标，修改请求已发出，结果被丢弃
+        self.missed = 0      # 未预测但校对低分（仍按原流程串行修改）
+        self._lock = threading.Lock()
+
+    def record(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "predicted": self.predicted,
+                "hits": self.hits,
+                "cancelled": self.cancelled,
+                "wasted": self.wasted,
+                "missed": self.missed,
+                "hit_rate": round(self.hits / self.predicted * 100, 2) if self.predicted else 0,
+                "waste_rate": round(self.wasted / self.predicted * 100, 2) if self.predicted else 0
+            }
+
+class Proofreader:
+    def __init__(self, translation_memory=None, ai_client=None, speculation_stats=None, speculation_executor=None):
+        self.ai = ai_client or AIClient()
+        self.tm = translation_memory
+        self.speculation_stats = speculation_stats or SpeculationStats()
+        # 推测性修改使用调用方提供的共享线程池（由调用方负责关闭），未提供时不做推测
+        self.speculation_executor = speculation_executor
+
+    def _speculation_enabled(self):
+        return Config.SPECULATIVE_MODIFY and self.speculation_executor is not None
+
+    def _submit_speculative_modify(self, item, tm_match, deadline):
+        """与校对并发提前发起修改请求"""
+        self.speculation_stats.record("predicted")
+        # 修改提示词不依赖分数，按0分调用即可强制发起修改
+        return self.speculation_executor.submit(self._smart_modify, item.source, item.target, 0, tm_match, deadline)
+
+    def _discard_speculative(self, speculative):
+        """丢弃推测结果：尚未发出的请求直接取消，已发出的记为浪费"""
+        self.speculation_stats.record("cancelled" if speculative.cancel() else "wasted")
 
-    def _build_prompt(self, source_text, target_text, mode="check"):
+    def _build_prompt(self, source_text, target_text, mode="check", tm_match=None):
         """构建校对提示词（从配置读取模板）"""
         if mode == "check":
-            return Config.CHECK_PROMPT_TEMPLATE.format(
+            prompt = Config.CHECK_PROMPT_TEMPLATE.format(
                 source_text=source_text,
                 target_text=target_text
             )
         elif mode == "modify":
-            return Config.MODIFY_PROMPT_TEMPLATE.format(
+            prompt = Config.MODIFY_PROMPT_TEMPLATE.format(
                 source_text=source_text,
                 target_text=target_text
             )
         else:
             raise ValueError(f"不支持的模式: {mode}")
 
+        # 附加翻译记忆中相似原文的审定译文作为参考
+        if tm_match is not None:
+            prompt += (
+                "\n\n参考（相似原文的历史审定译文，仅供参考）：\n"
+                f"原文: {tm_match.entry.source}\n"
+                f"译文: {tm_match.entry.modified_text}"
+            )
+        return prompt
+
     def _parse_ai_response(self, response_text):
         """解析AI响应，提取JSON内容"""
         # 如果响应是列表，提取其中的文本内容
@@ -56,6 +151,26 @@ class Proofreader:
                 "raw_response": response_text[:200] + "..." if len(response_text) > 200 else response_text
             }
 
+    def _normalize_score(self, parsed_result):
+        """
+        解析后立即校验评分：数字字符串转为数值
+        缺少数值评分时按0分处理并保留原始响应（报告不进入翻译记忆）
+        """
+        if not isinstance(parsed_result, dict):
+            parsed_result = {
+                "is_correct": False,
+                "issues": [],
+                "comment": "AI响应格式错误",
+                "raw_response": str(parsed_result)[:200]
+            }
+        score = coerce_score(parsed_result.get('score'))
+        if score is None:
+            score = 0
+            if 'raw_response' not in parsed_result:
+                parsed_result['raw_response'] = json.dumps(parsed_result, ensure_ascii=False)[:200]
+        parsed_result['score'] = score
+        return parsed_result
+
     def _get_modification_level(self, score):
         """根据分数确定修改级别"""
         if score >= 85:
@@ -67,58 +182,128 @@ class Proofreader:
         else:
             return "大幅重构"
     
-    def _process_single_item(self, item):
+    def _build_tm_report(self, item, tm_match):
+        """由翻译记忆命中结果直接生成报告，不调用AI"""
+        entry = tm_match.entry
+        return {
+            "original_index": item.index,
+            "name": item.name,
+            "source_text": item.source,
+            "target_text": item.target,
+            "score": entry.score,
+            "modified_text": tm_match.modified_text,
+            "comment": entry.comment,
+            "is_correct": entry.is_correct,
+            "style_type": entry.style_type,
+            "style_applied": entry.style_applied,
+            "changes_reason": entry.changes_reason,
+            "issues": [],
+            "modification_level": self._get_modification_level(entry.score),
+            "tm_match": tm_match.as_report_info()
+        }
+
+    def _build_report(self, item, parsed_result, modification_result, tm_match=None):
+        """根据校对和修改结果构建精简报告，并加入翻译记忆"""
+        score = parsed_result.get('score', 0)
+        final_report = {
+            "original_index": item.index,
+            "name": item.name,
+            "source_text": item.source,
+            "target_text": item.target,
+            "score": score,
+            "modified_text": modification_result.get('modified_text', item.target),
+            "comment": parsed_result.get('comment', ''),
+            "is_correct": parsed_result.get('is_correct', False),
+            "style_type": intern_str(parsed_result.get('style_type', '普通翻译')),
+            "style_applied": intern_str(modification_result.get('style_applied', '未应用')),
+            "changes_reason": modification_result.get('changes_reason', '无修改'),
+            "issues": parsed_result.get('issues', []),
+            "modification_level": self._get_modification_level(score)
+        }
+        if tm_match is not None:
+            final_report["tm_match"] = tm_match.as_report_info()
+        # 校对响应无法解析或缺少数值评分时保留原始响应（见_normalize_score），这类结果不进入翻译记忆
+        if 'raw_response' in parsed_result:
+            final_report["raw_response"] = parsed_result['raw_response']
+
+        # 本次结果也加入翻译记忆，供同一批次中的近似行复用
+        if self.tm is not None:
+            self.tm.add(final_report)
+        
+        return final_report
+
+    def _lookup_tm(self, item):
+        """查询翻译记忆，未启用时返回None"""
+        if self.tm is None:
+            return None
+        return self.tm.lookup(item.source, item.target, context_threshold=Config.TM_CONTEXT_THRESHOLD)
+
+    def _item_deadline(self, item, deadline):
+        """条目级截止时间（不晚于文件级截止时间）"""
+        return (deadline or Deadline()).child(Config.ITEM_TIMEOUT, name=f"第{item.index}条")
+
+    def _process_single_item(self, item, deadline=None):
         """处理单个校对项目（用于并发执行）"""
+        deadline = self._item_deadline(item, deadline)
         try:
+            # 第零步：查询翻译记忆，模板完全一致时直接复用历史结果
+            tm_match = self._lookup_tm(item)
+            if tm_match is not None and tm_match.reusable:
+                return self._build_tm_report(item, tm_match)
+
+            # 预测可能低分时，修改请求与校对并发发起
+            speculative = None
+            if self._speculation_enabled() and predict_low_score(item.source, item.target):
+                speculative = self._submit_speculative_modify(item, tm_match, deadline)
+
             # 第一步：校对评分
-            check_prompt = self._build_prompt(item['source'], item['target'], mode="check")
+            check_prompt = self._build_prompt(item.source, item.target, mode="check", tm_match=tm_match)
             
-            # 调用AI接口进行校对
-            check_result = self.ai.chat([{"role": "user", "content": check_prompt}])
-            
-            # 解析校对结果
-            parsed_result = self._parse_ai_response(check_result)
+            # 调用AI接口进行校对，解析并校验评分
+            try:
+                check_result = self.ai.chat([{"role": "user", "content": check_prompt}], deadline)
+                parsed_result = self._normalize_score(self._parse_ai_response(check_result))
+            except Exception:
+                if speculative is not None:
+                    self._discard_speculative(speculative)
+                raise
             
             # 获取评分
-            score = parsed_result.get('score', 0)
-            issues = parsed_result.get('issues', [])
+            score = parsed_result['score']
             
             # 根据分数决定是否进行修改
-            modification_result = self._smart_modify(
-                item['source'], 
-                item['target'], 
-                score
-            )
-            
-            # 构建精简报告
-            final_report = {
-                "original_index": item['index'],
-                "name": item['name'],
-                "source_text": item['source'],
-                "target_text": item['target'],
-                "score": score,
-                "modified_text": modification_result.get('modified_text', item['target']),
-                "comment": parsed_result.get('comment', ''),
-                "is_correct": parsed_result.get('is_correct', False),
-                "style_type": parsed_result.get('style_type', '普通翻译'),
-                "style_applied": modification_result.get('style_applied', '未应用'),
-                "changes_reason": modification_result.get('changes_reason', '无修改'),
-                "issues": issues,
-                "modification_level": self._get_modification_level(score)
-            }
+            if speculative is not None and score < 85:
+                modification_result = speculative.result()
+                self.speculation_stats.record("hits")
+            else:
+                if speculative is not None:
+                    # 校对达标，丢弃推测结果
+                    self._discard_speculative(speculative)
+                elif self._speculation_enabled() and score < 85:
+                    self.speculation_stats.record("missed")
+                modification_result = self._smart_modify(
+                    item.source, 
+                    item.target, 
+                    score,
+                    tm_match=tm_match,
+                    deadline=deadline
+                )
             
-            return final_report
+            return self._build_report(item, parsed_result, modification_result, tm_match)
             
+        except STOP_DISPATCH:
+            # 预算用尽或运行取消时不生成错误报告，由上层停止派发
+            raise
         except Exception as e:
             # 处理各种异常
             return {
-                "original_index": item['index'],
-                "name": item['name'],
-                "source_text": item['source'],
-                "target_text": item['target'],
+                "original_index": item.index,
+                "name": item.name,
+                "source_text": item.source,
+                "target_text": item.target,
                 "score": 0,
                 "issues": [{"type": "处理错误", "description": str(e)}],
-                "modified_text": item['target'],
+                "modified_text": item.target,
                 "comment": f"处理出错: {str(e)}",
                 "is_correct": False,
                 "style_type": "错误处理",
@@ -128,15 +313,69 @@ class Proofreader:
                 "error": str(e)
             }
     
-    def _poll_process_batch(self, batch):
-        """轮询并发处理批次"""
+    def check_only(self, item, deadline=None):
+        """只做校对评分、不修改（抽样模式使用），AI响应无法解析或缺少数值评分时报告带error字段"""
+        if self.tm is not None:
+            tm_match = self.tm.find_reusable(item.source, item.target)
+            if tm_match is not None:
+                return self._build_tm_report(item, tm_match)
+
+        check_prompt = self._build_prompt(item.source, item.target, mode="check")
+        deadline = self._item_deadline(item, deadline)
+        parsed_result = self._normalize_score(
+            self._parse_ai_response(self.ai.chat([{"role": "user", "content": check_prompt}], deadline))
+        )
+        score = parsed_result['score']
+        report = {
+            "original_index": item.index,
+            "name": item.name,
+            "source_text": item.source,
+            "target_text": item.target,
+            "score": score,
+            "modified_text": item.target,
+            "comment": parsed_result.get('comment', ''),
+            "is_correct": parsed_result.get('is_correct', False),
+            "style_type": intern_str(parsed_result.get('style_type', '普通翻译')),
+            "style_applied": "抽样校对",
+            "changes_reason": "抽样模式不修改",
+            "issues": parsed_result.get('issues', []),
+            "modification_level": self._get_modification_level(score)
+        }
+        # 响应无法解析或缺少数值评分时记为失败样本，不能当作0分参与估计
+        if 'raw_response' in parsed_result:
+            report["error"] = "AI响应格式错误或缺少数值评分"
+            report["raw_response"] = parsed_result['raw_response']
+        return report
+
+    def _timeout_report(self, item, message):
+        """超时条目的错误报告"""
+        return {
+            "original_index": item.index,
+            "name": item.name,
+            "source_text": item.source,
+            "target_text": item.target,
+            "score": 0,
+            "issues": [{"type": "超时错误", "description": message}],
+            "modified_text": item.target,
+            "comment": f"处理超时: {message}",
+            "is_correct": False,
+            "style_type": "超时处理",
+            "style_applied": "超时处理",
+            "changes_reason": message,
+            "modification_level": f"处理超时: {message}",
+            "error": message
+        }
+
+    def _poll_process_batch(self, batch, deadline=None):
+        """轮询并发处理批次，截止时间到达或取消时不再等待未完成的条目"""
         reports = []
         
         # 使用线程池进行并发处理
-        with ThreadPoolExecutor(max_workers=Config.CONCURRENT_REQUESTS) as executor:
+        executor = ThreadPoolExecutor(max_workers=Config.CONCURRENT_REQUESTS)
+        try:
             # 提交所有任务
             future_to_item = {
-                executor.submit(self._process_single_item, item): item 
+                executor.submit(self._process_single_item, item, deadline): item 
                 for item in batch
             }
             
@@ -146,39 +385,36 @@ class Proofreader:
                 for future in future_to_item:
                     if future not in completed_futures and future.done():
                         try:
-                            result = future.result(timeout=Config.REQUEST_TIMEOUT)
+                            result = future.result()
                             reports.append(result)
                             completed_futures.add(future)
+                        except STOP_DISPATCH:
+                            raise
                         except Exception as e:
-                            item = future_to_item[future]
-                            error_report = {
-                                "original_index": item['index'],
-                                "name": item['name'],
-                                "source_text": item['source'],
-                                "target_text": item['target'],
-                                "score": 0,
-                                "issues": [{"type": "超时错误", "description": str(e)}],
-                                "modified_text": item['target'],
-                                "comment": f"处理超时: {str(e)}",
-                                "is_correct": False,
-                                "style_type": "超时处理",
-                                "style_applied": "超时处理",
-                                "changes_reason": str(e),
-                                "modification_level": f"处理超时: {str(e)}",
-                                "error": str(e)
-                            }
-                            reports.append(error_report)
+                            reports.append(self._timeout_report(future_to_item[future], str(e)))
                             completed_futures.add(future)
                 
-                # 如果还有未完成的任务，短暂休眠
                 if len(completed_futures) < len(future_to_item):
+                    if deadline is not None and deadline.cancelled():
+                        raise Cancelled("运行已取消")
+                    if deadline is not None and deadline.expired():
+                        # 截止时间已到，剩余条目记为超时，不再等待
+                        for future, item in future_to_item.items():
+                            if future not in completed_futures:
+                                future.cancel()
+                                reports.append(self._timeout_report(item, f"{deadline.name}超时"))
+                        break
+                    # 如果还有未完成的任务，短暂休眠
                     time.sleep(Config.POLLING_INTERVAL)
+        finally:
+            # 不等待仍在进行中的请求，未开始的任务直接取消
+            executor.shutdown(wait=False, cancel_futures=True)
         
         # 按原始索引排序确保顺序一致
         reports.sort(key=lambda x: x['original_index'])
         return reports
     
-    def _smart_modify(self, source_text, target_text, score):
+    def _smart_modify(self, source_text, target_text, score, tm_match=None, deadline=None):
         """根据分数智能修改翻译文本（支持多风格）"""
         try:
             # 85分以上不修改
@@ -190,10 +426,10 @@ class Proofreader:
                 }
             
             # 构建修改提示词
-            prompt = self._build_prompt(source_text, target_text, mode="modify")
+            prompt = self._build_prompt(source_text, target_text, mode="modify", tm_match=tm_match)
             
             # 调用AI进行修改
-            result = self.ai.chat([{"role": "user", "content": prompt}])
+            result = self.ai.chat([{"role": "user", "content": prompt}], deadline)
             
             # 解析修改结果
             if isinstance(result, list):
@@ -220,6 +456,8 @@ class Proofreader:
                     "changes_reason": "AI响应格式错误"
                 }
                 
+        except STOP_DISPATCH:
+            raise
         except Exception as e:
             # 如果修改过程出错，返回原始文本
             return {
@@ -228,11 +466,78 @@ class Proofreader:
                 "changes_reason": str(e)
             }
     
-    def proofread_batch(self, batch):
+    def _parse_window_results(self, response_text, size):
+        """解析窗口校对结果，返回 {窗口内序号: 单行结果}"""
+        parsed = self._parse_ai_response(response_text)
+        results = parsed.get('results', []) if isinstance(parsed, dict) else []
+        by_id = {}
+        for result in results if isinstance(results, list) else []:
+            if not isinstance(result, dict):
+                continue
+            try:
+                pos = int(result.get('id'))
+            except (TypeError, ValueError):
+                continue
+            # 缺少数值评分的行不采用，退回单条处理
+            score = coerce_score(result.get('score'))
+            if 0 <= pos < size and score is not None:
+                result['score'] = score
+                by_id[pos] = result
+        return by_id
+
+    def proofread_window(self, window, deadline=None):
+        """
+        上下文窗口校对：连续多行一次请求评分，低分行再逐行修改
+        窗口请求失败或缺少某行结果时，该行退回单条处理
+        """
+        reports = []
+        pending = []
+        for item in window:
+            tm_match = self._lookup_tm(item)
+            if tm_match is not None and tm_match.reusable:
+                reports.append(self._build_tm_report(item, tm_match))
+            else:
+                pending.append((item, tm_match))
+
+        if len(pending) <= 1:
+            return sorted(reports + self.proofread_batch([item for item, _ in pending], deadline),
+                          key=lambda x: x['original_index'])
+
+        items = [item for item, _ in pending]
+        prompt = Config.WINDOW_CHECK_PROMPT_TEMPLATE.format(lines=format_window_lines(items))
+        window_deadline = (deadline or Deadline()).child(Config.ITEM_TIMEOUT, name=f"第{items[0].index}-{items[-1].index}条")
+        try:
+            by_id = self._parse_window_results(
+                self.ai.chat([{"role": "user", "content": prompt}], window_deadline), len(items)
+            )
+        except STOP_DISPATCH:
+            raise
+        except Exception:
+            by_id = {}
+
+        fallback = [item for pos, item in enumerate(items) if pos not in by_id]
+        with ThreadPoolExecutor(max_workers=Config.CONCURRENT_REQUESTS) as executor:
+            futures = [
+                (item, tm_match, by_id[pos],
+                 executor.submit(self._smart_modify, item.source, item.target, by_id[pos]['score'], tm_match,
+                                 self._item_deadline(item, deadline)))
+                for pos, (item, tm_match) in enumerate(pending) if pos in by_id
+            ]
+            for item, tm_match, parsed_result, future in futures:
+                reports.append(self._build_report(item, parsed_result, future.result(), tm_match))
+
+        if fallback:
+            reports.extend(self.proofread_batch(fallback, deadline))
+
+        reports.sort(key=lambda x: x['original_index'])
+        return reports
+
+    def proofread_batch(self, batch, deadline=None):
         """
-        batch: [{"index":0,"name":...,"source":...,"target":...}, ...]
+        batch: [PairItem(index, name, source, target), ...]
+        deadline: 文件级截止时间，每条另有 ITEM_TIMEOUT 的条目级截止时间
         返回 JSON 校对结果，包含智能修改功能
         使用轮询并发处理提高效率
         """
         # 使用轮询并发处理
-        return self._poll_process_batch(batch)
+        return self._poll_process_batch(batch, deadline)
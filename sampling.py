@@ -0,0 +1,233 @@
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from budget import BudgetExceeded
+from deadline import Cancelled, DeadlineExceeded
+
+# 95%置信度对应的正态分位数
+Z_95 = 1.96
+
+
+def _length_bucket(text):
+    """按原文长度分层：短句/中等/长句"""
+    length = len(text)
+    if length <= 10:
+        return "short"
+    if length <= 30:
+        return "medium"
+    return "long"
+
+
+# 每层期望至少分到的样本数（层内方差至少需要2条）
+MIN_PER_STRATUM = 2
+# 合并后的层标记
+MERGED = "*"
+
+
+def build_strata(table, sample_size=None):
+    """
+    按 (说话人, 原文长度) 分层，返回 {层: [行号, ...]}
+    给出sample_size时合并按比例分不到 MIN_PER_STRATUM 条的小层：
+    先并入同一说话人的 (说话人, *) 层，仍然太小的再并入 (*, *) 层
+    """
+    strata = {}
+    for row in range(len(table)):
+        key = (table.names[row], _length_bucket(table.sources[row]))
+        strata.setdefault(key, []).append(row)
+    if sample_size is None or sample_size >= len(table):
+        return strata
+
+    min_size = MIN_PER_STRATUM * len(table) / sample_size
+    merged = {}
+    by_speaker = {}
+    for key, rows in strata.items():
+        if len(rows) >= min_size:
+            merged[key] = rows
+        else:
+            by_speaker.setdefault((key[0], MERGED), []).extend(rows)
+    pooled = []
+    for key, rows in by_speaker.items():
+        if len(rows) >= min_size:
+            merged[key] = sorted(rows)
+        else:
+            pooled.extend(rows)
+    if pooled:
+        merged[(MERGED, MERGED)] = sorted(pooled)
+    return merged
+
+
+def allocate(strata, sample_size, rng):
+    """
+    按层大小比例分配样本量：每层至少1条，其余按最大余数法分配，余数相同时随机决定
+    每层不超过层大小（build_strata已合并小层，层数不超过样本量）
+    """
+    total = sum(len(rows) for rows in strata.values())
+    if sample_size >= total:
+        return {key: len(rows) for key, rows in strata.items()}
+
+    quotas = {key: sample_size * len(rows) / total for key, rows in strata.items()}
+    # 层数多于样本量时（未经build_strata合并）无法保证每层1条
+    floor = 1 if len(strata) <= sample_size else 0
+    allocation = {key: min(max(int(q), floor), len(strata[key])) for key, q in quotas.items()}
+    remaining = sample_size - sum(allocation.values())
+    candidates = [key for key in strata if allocation[key] < len(strata[key])]
+    order = sorted(candidates, key=lambda k: (quotas[k] - allocation[k], rng.random()), reverse=True)
+    for key in order[:max(remaining, 0)]:
+        allocation[key] += 1
+    return allocation
+
+
+def stratified_sample(table, sample_size, rng):
+    """分层随机抽样，返回 ({层: [行号, ...]}, [(层, PairItem), ...])"""
+    strata = build_strata(table, sample_size)
+    allocation = allocate(strata, sample_size, rng)
+    sample = []
+    for key, rows in strata.items():
+        for row in rng.sample(rows, allocation[key]):
+            sample.append((key, table.item(row)))
+    return strata, sample
+
+
+def _stratified_estimate(strata_sizes, values_by_stratum, upper):
+    """
+    分层均值估计及其95%置信区间（含有限总体校正），权重按全部待校对条目计算
+    没有有效样本的层（校对失败或中途停止）不重新归一化：点估计用全体样本均值代入，
+    区间按这部分取值可能在 [0, upper] 之间的任何位置放宽
+    返回 (估计值, 下限, 上限, 未覆盖比例)
+    """
+    population = sum(strata_sizes.values())
+    all_values = [v for values in values_by_stratum.values() for v in values]
+    if population == 0 or not all_values:
+        return None
+
+    # 样本量不足2的层借用全体样本方差
+    pooled_mean = sum(all_values) / len(all_values)
+    pooled_var = _sample_variance(all_values)
+
+    covered = 0.0
+    estimate = 0.0
+    variance = 0.0
+    for key, values in values_by_stratum.items():
+        size = strata_sizes[key]
+        weight = size / population
+        n = len(values)
+        covered += weight
+        estimate += weight * sum(values) / n
+        s2 = _sample_variance(values) if n >= 2 else pooled_var
+        variance += weight ** 2 * (1 - n / size) * s2 / n
+
+    unsampled = max(1.0 - covered, 0.0)
+    margin = Z_95 * math.sqrt(max(variance, 0.0))
+    return (estimate + unsampled * pooled_mean,
+            estimate - margin,
+            estimate + margin + unsampled * upper,
+            unsampled)
+
+
+def _sample_variance(values):
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean = sum(values) / n
+    return sum((v - mean) ** 2 for v in values) / (n - 1)
+
+
+def estimate_file_quality(strata_sizes, reports_by_stratum):
+    """根据抽样结果估计文件的准确率和平均分"""
+    scores = {key: [r['score'] for r in reports] for key, reports in reports_by_stratum.items() if reports}
+    correct = {key: [1.0 if r['is_correct'] else 0.0 for r in reports]
+               for key, reports in reports_by_stratum.items() if reports}
+
+    accuracy = _stratified_estimate(strata_sizes, correct, 1.0)
+    average = _stratified_estimate(strata_sizes, scores, 100.0)
+    if accuracy is None or average is None:
+        return None
+
+    clip = lambda value, upper: round(min(max(value, 0.0), upper), 2)
+    return {
+        "accuracy_rate": clip(accuracy[0] * 100, 100),
+        "accuracy_ci": [clip(accuracy[1] * 100, 100), clip(accuracy[2] * 100, 100)],
+        "average_score": clip(average[0], 100),
+        "average_score_ci": [clip(average[1], 100), clip(average[2], 100)],
+        # 没有有效样本的层占全部待校对条目的比例
+        "unsampled_share": round(accuracy[3], 4)
+    }
+
+
+def _to_score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def sample_file(table, proofreader, sample_size, rng, deadline=None):
+    """对单个文件分层抽样并只做校对评分，返回抽样结果（预算用尽、超时或取消时stopped为True）"""
+    strata, sample = stratified_sample(table, sample_size, rng)
+    strata_sizes = {key: len(rows) for key, rows in strata.items()}
+
+    reports_by_stratum = {}
+    failed = 0
+    stopped = False
+    with ThreadPoolExecutor(max_workers=Config.CONCURRENT_REQUESTS) as executor:
+        futures = [(key, executor.submit(proofreader.check_only, item, deadline)) for key, item in sample]
+        for key, future in futures:
+            try:
+                report = future.result()
+            except KeyboardInterrupt:
+                if deadline is None or deadline.cancelled():
+                    raise
+                # 通知其余抽样请求尽快退出
+                print("\n⏹️ 收到中断信号，正在停止抽样...")
+                deadline.cancel()
+                stopped = True
+                continue
+            except (BudgetExceeded, Cancelled):
+                stopped = True
+                continue
+            except DeadlineExceeded:
+                # 运行级截止时间已到视为停止，单条超时计为失败
+                if deadline is not None and deadline.expired():
+                    stopped = True
+                else:
+                    failed += 1
+                continue
+            except Exception:
+                failed += 1
+                continue
+            if report.get('error'):
+                failed += 1
+                continue
+            report['score'] = _to_score(report.get('score', 0))
+            reports_by_stratum.setdefault(key, []).append(report)
+
+    checked = sum(len(reports) for reports in reports_by_stratum.values())
+    result = {
+        "total_entries": table.total_entries,
+        "population": len(table),
+        "strata": len(strata),
+        "sample_size": len(sample),
+        "checked": checked,
+        "failed": failed,
+        "stopped": stopped,
+        "estimate": estimate_file_quality(strata_sizes, reports_by_stratum) if checked else None,
+        "reports": sorted(
+            (r for reports in reports_by_stratum.values() for r in reports),
+            key=lambda r: r['original_index']
+        )
+    }
+    return result
+
+
+def needs_full_run(result):
+    """估计准确率低于阈值（或无法估计）的文件需要完整校对"""
+    estimate = result.get('estimate')
+    if estimate is None:
+        return True
+    return (estimate['accuracy_rate'] < Config.SAMPLE_ESCALATE_ACCURACY
+            or estimate['average_score'] < Config.SAMPLE_ESCALATE_SCORE)
+
+
+def make_rng():
+    return random.Random(Config.SAMPLE_SEED)
@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import api_client
+from api_client import AIClient
+from config import Config
+from endpoint_pool import CLOSED, FAILURE, HALF_OPEN, OPEN, RATE_LIMITED, Endpoint, EndpointPool
+
+
+class MockServer:
+    """本地模拟API端点：可设置返回状态码和响应延迟，记录请求数和最大在途请求数"""
+
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.delay = delay
+        self.hits = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    server.hits += 1
+                    server.inflight += 1
+                    server.max_inflight = max(server.max_inflight, server.inflight)
+                time.sleep(server.delay)
+                body = json.dumps({"content": [{"text": "ok"}], "usage": {"output_tokens": 1}}).encode()
+                self.send_response(server.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.inflight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def reset_counts(self):
+        with self._lock:
+            self.hits = 0
+            self.max_inflight = 0
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def servers():
+    created = []
+
+    def make(count, **kwargs):
+        batch = [MockServer(**kwargs) for _ in range(count)]
+        created.extend(batch)
+        return batch
+
+    yield make
+    for server in created:
+        server.close()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(api_client, "RETRY_WAIT", 0)
+    monkeypatch.setattr(Config, "MAX_RETRIES", 3)
+
+
+def make_client(mock_servers, failure_threshold=2, cooldown=30.0, max_concurrent=5, rate_limit_backoff=5.0):
+    endpoints = [
+        Endpoint(server.base_url, "test-key", max_concurrent=max_concurrent, name=f"ep{i}")
+        for i, server in enumerate(mock_servers)
+    ]
+    pool = EndpointPool(endpoints, failure_threshold=failure_threshold, cooldown=cooldown,
+                        rate_limit_backoff=rate_limit_backoff)
+    return AIClient(pool=pool), pool
+
+
+def chat(client):
+    return client.chat([{"role": "user", "content": "hi"}])
+
+
+def test_ties_are_balanced_round_robin(servers):
+    mock_servers = servers(3)
+    client, _ = make_client(mock_servers)
+
+    for _ in range(6):
+        assert chat(client) == "ok"
+
+    assert [server.hits for server in mock_servers] == [2, 2, 2]
+
+
+def test_least_outstanding_endpoint_is_chosen(servers):
+    slow, fast = servers(1, delay=0.5) + servers(1)
+    client, pool = make_client([slow, fast])
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # 第一个请求落在ep0并保持在途，其余请求应全部分配给空闲的ep1
+        pending = executor.submit(chat, client)
+        while slow.hits == 0:
+            time.sleep(0.01)
+        for _ in range(3):
+            chat(client)
+        assert pending.result() == "ok"
+
+    assert slow.hits == 1
+    assert fast.hits == 3
+
+
+def test_endpoint_is_ejected_after_failure_threshold(servers):
+    broken, healthy = servers(1, status=500) + servers(1)
+    client, pool = make_client([broken, healthy], failure_threshold=2)
+
+    for _ in range(6):
+        # 失败请求在重试时转移到健康端点
+        assert chat(client) == "ok"
+
+    assert broken.hits == 2
+    stats = {ep["name"]: ep for ep in pool.stats()}
+    assert stats["ep0"]["state"] == OPEN
+    assert stats["ep0"]["ejection_count"] == 1
+    assert stats["ep0"]["failure_count"] == 2
+    assert stats["ep1"]["success_count"] == 6
+
+
+def test_half_open_allows_single_probe_then_recovers(servers):
+    flaky, healthy = servers(1, status=500) + servers(1)
+    client, pool = make_client([flaky, healthy], failure_threshold=1, cooldown=0.3)
+
+    chat(client)
+    assert pool.endpoints[0].state == OPEN
+
+    # 冷却结束后端点恢复，但响应较慢：并发请求中只有一个探测请求能落在该端点
+    flaky.status = 200
+    flaky.delay = 0.4
+    flaky.reset_counts()
+    time.sleep(0.35)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(lambda _: chat(client), range(6)))
+        assert results == ["ok"] * 6
+
+    assert flaky.hits == 1
+    assert flaky.max_inflight == 1
+    assert pool.endpoints[0].state == CLOSED
+
+    # 探测成功后重新参与负载均衡
+    flaky.delay = 0.0
+    flaky.reset_counts()
+    for _ in range(4):
+        chat(client)
+    assert flaky.hits == 2
+
+
+def test_failed_probe_reopens_circuit():
+    pool = EndpointPool(
+        [Endpoint("http://a", "k", max_concurrent=2, name="a"), Endpoint("http://b", "k", max_concurrent=1, name="b")],
+        failure_threshold=1, cooldown=0.05
+    )
+    endpoint = pool.acquire()
+    # 占满另一个端点，只剩熔断中的端点
+    assert pool.acquire().name == "b"
+    pool.release(endpoint, FAILURE)
+    assert endpoint.state == OPEN
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+
+    time.sleep(0.06)
+    probe = pool.acquire(timeout=0.1)
+    assert probe.state == HALF_OPEN
+    # 探测请求在途时不再放行其他请求
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.02)
+    pool.release(probe, FAILURE)
+    assert endpoint.state == OPEN
+    assert endpoint.ejection_count == 2
+
+
+def test_last_endpoint_is_never_ejected(servers):
+    broken, = servers(1, status=500)
+    client, pool = make_client([broken], failure_threshold=1)
+
+    with pytest.raises(Exception):
+        chat(client)
+
+    # 唯一的端点不熔断，重试不会阻塞在冷却上
+    assert broken.hits == Config.MAX_RETRIES
+    assert pool.endpoints[0].state == CLOSED
+    assert pool.endpoints[0].ejection_count == 0
+
+
+def test_client_errors_do_not_eject(servers):
+    rejecting, healthy = servers(1, status=400) + servers(1)
+    client, pool = make_client([rejecting, healthy], failure_threshold=1)
+
+    for _ in range(4):
+        assert chat(client) == "ok"
+
+    stats = {ep["name"]: ep for ep in pool.stats()}
+    assert rejecting.hits >= 2
+    assert stats["ep0"]["state"] == CLOSED
+    assert stats["ep0"]["ejection_count"] == 0
+    assert stats["ep0"]["rejected_count"] == rejecting.hits
+
+
+def test_rate_limit_backs_off_without_ejecting(servers):
+    limited, healthy = servers(1, status=429) + servers(1)
+    client, pool = make_client([limited, healthy], failure_threshold=1, rate_limit_backoff=0.3)
+
+    for _ in range(4):
+        assert chat(client) == "ok"
+    # 暂停期间请求全部分配给另一个端点
+    assert limited.hits == 1
+    assert pool.endpoints[0].state == CLOSED
+    assert pool.endpoints[0].ejection_count == 0
+
+    limited.status = 200
+    time.sleep(0.35)
+    for _ in range(4):
+        chat(client)
+    assert limited.hits == 3
+
+
+def test_rate_limited_single_endpoint_waits_for_backoff():
+    pool = EndpointPool([Endpoint("http://a", "k", max_concurrent=2, name="a")], rate_limit_backoff=0.1)
+    endpoint = pool.acquire()
+    pool.release(endpoint, RATE_LIMITED)
+    assert endpoint.state == CLOSED
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.02)
+    assert pool.acquire(timeout=0.5) is endpoint
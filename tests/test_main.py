@@ -0,0 +1,68 @@
+import threading
+import time
+import types
+
+import pytest
+
+import main
+from deadline import Deadline
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(main, "time", types.SimpleNamespace(sleep=lambda seconds: time.sleep(0.01)))
+
+
+def fake_results(monkeypatch, delays=None, gate=None):
+    """用假的文件处理替换process_file_pair_parallel，gate未放行前慢文件保持进行中"""
+    def process(pair, proofreader, done_reports=None, deadline=None):
+        if pair['base_name'] in (delays or ()):
+            gate.wait(10)
+        return {"base_name": pair['base_name'], "reports": [], "filename": pair['base_name'], "stopped": False,
+                "table": object()}
+    monkeypatch.setattr(main, "process_file_pair_parallel", process)
+
+
+def pairs(*names):
+    return [{"base_name": name, "en_file": name, "zh_file": name} for name in names]
+
+
+def test_interrupt_inside_on_result_does_not_duplicate_results(monkeypatch, fast_polling):
+    fake_results(monkeypatch)
+    calls = []
+
+    def on_result(result):
+        calls.append(result['base_name'])
+        result.pop('table')
+        if len(calls) == 1:
+            # 写出过程中收到Ctrl-C
+            raise KeyboardInterrupt
+        result['modified_count'] = 0
+
+    deadline = Deadline()
+    results = main.process_files_concurrently(pairs("a", "b", "c"), on_result=on_result, deadline=deadline)
+
+    assert deadline.cancelled()
+    assert sorted(calls) == ["a", "b", "c"]
+    # 被中断的文件不计入结果，其余文件各出现一次且已写出
+    assert len(results) == 2
+    assert len({r['base_name'] for r in results}) == 2
+    assert all('modified_count' in r for r in results)
+
+
+def test_second_interrupt_does_not_wait_for_running_files(monkeypatch, fast_polling):
+    gate = threading.Event()
+    fake_results(monkeypatch, delays=("slow",), gate=gate)
+
+    def on_result(result):
+        raise KeyboardInterrupt
+
+    deadline = Deadline()
+    deadline.cancel()
+    start = time.time()
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            main.process_files_concurrently(pairs("slow", "fast"), on_result=on_result, deadline=deadline)
+        assert time.time() - start < 2
+    finally:
+        gate.set()
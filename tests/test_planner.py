@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from config import Config
+from endpoint_pool import Endpoint, EndpointPool
+from planner import plan_run
+
+
+class FakeClient:
+    def __init__(self, limits):
+        self.pool = EndpointPool([Endpoint(f"http://ep{i}", "k", max_concurrent=n) for i, n in enumerate(limits)])
+
+
+def make_pairs(tmp_path, sizes):
+    pairs = []
+    for i, size in enumerate(sizes):
+        zh = tmp_path / f"f{i}_zh.json"
+        en = tmp_path / f"f{i}_en.json"
+        zh.write_text(json.dumps([{"name": "甲", "message": f"第{i}-{j}句"} for j in range(size)], ensure_ascii=False),
+                      encoding="utf-8")
+        en.write_text(json.dumps([{"name": "甲", "message": f"Line {i}-{j}"} for j in range(size)]), encoding="utf-8")
+        pairs.append({"base_name": f"f{i}", "zh_file": str(zh), "en_file": str(en)})
+    return pairs
+
+
+def test_recommendation_is_bounded_by_longest_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_WINDOW_ENABLED", False)
+    # 一个大文件主导总耗时：并发超过2个文件不会更快
+    pairs = make_pairs(tmp_path, [100, 10, 10, 10, 10, 10])
+    plan = plan_run(pairs, ai_client=FakeClient([5, 5]), report_folder=str(tmp_path))
+
+    assert plan['recommended_concurrent_files'] == 2
+    assert plan['recommended_concurrent_requests'] is None
+    assert plan['recommended_wall_seconds'] == plan['longest_file_seconds']
+
+
+def test_recommends_more_endpoint_concurrency_when_saturated(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_WINDOW_ENABLED", False)
+    monkeypatch.setattr(Config, "CONCURRENT_FILES", 8)
+    pairs = make_pairs(tmp_path, [10] * 8)
+    plan = plan_run(pairs, ai_client=FakeClient([1, 2]), report_folder=str(tmp_path), use_parallel=True)
+
+    # 8个同等大小的文件可以全部并行，但端点总并发只有3
+    assert plan['recommended_concurrent_files'] == 3
+    assert plan['concurrency'] == 3
+    assert plan['recommended_concurrent_requests'] == 4
+    assert plan['wall_seconds'] == pytest.approx(plan['total_requests'] * plan['latency'] / 3)
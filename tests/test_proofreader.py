@@ -0,0 +1,173 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from config import Config
+from proofreader import Proofreader, SpeculationStats
+from translation_memory import TranslationMemory
+from utils import PairItem
+
+
+class FakeAI:
+    """按提示词类型返回固定的校对/修改结果"""
+
+    def __init__(self, score):
+        self.score = score
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def chat(self, messages, deadline=None):
+        content = messages[0]["content"]
+        with self._lock:
+            self.prompts.append(content)
+        if "资深翻译编辑" in content:
+            return json.dumps({"modified_text": "Fixed", "style_applied": "游戏标准", "changes_reason": "r"})
+        is_correct = isinstance(self.score, int) and self.score >= 85
+        return json.dumps({"score": self.score, "is_correct": is_correct, "comment": "c"})
+
+
+@pytest.fixture
+def speculative(monkeypatch):
+    monkeypatch.setattr(Config, "SPECULATIVE_MODIFY", True)
+    monkeypatch.setattr(Config, "POLLING_INTERVAL", 0.01)
+
+
+def low_score_item(index=0):
+    # 译文残留中文，预测为低分
+    return PairItem(index, "甲", "你好世界", "Hello 世界")
+
+
+def test_proofreaders_share_the_caller_executor(speculative):
+    stats = SpeculationStats()
+    ai = FakeAI(score=40)
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        before = threading.active_count()
+        for i in range(20):
+            # 并行模式下每个文件一个Proofreader，不应各自创建线程池
+            report = Proofreader(None, ai, stats, executor).proofread_batch([low_score_item(i)])[0]
+            assert report["modified_text"] == "Fixed"
+        assert threading.active_count() - before <= 2 + Config.CONCURRENT_REQUESTS
+    finally:
+        executor.shutdown()
+
+    result = stats.stats()
+    assert result["predicted"] == 20
+    assert result["hits"] == 20
+
+
+def test_no_speculation_without_executor(speculative):
+    stats = SpeculationStats()
+    ai = FakeAI(score=40)
+    report = Proofreader(None, ai, stats).proofread_batch([low_score_item()])[0]
+
+    assert report["modified_text"] == "Fixed"
+    assert stats.stats()["predicted"] == 0
+    # 校对后串行修改：先校对再修改
+    assert "翻译校对员" in ai.prompts[0] and "资深翻译编辑" in ai.prompts[1]
+
+
+def test_wasted_speculation_is_discarded(speculative):
+    stats = SpeculationStats()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        report = Proofreader(None, FakeAI(score=95), stats, executor).proofread_batch([low_score_item()])[0]
+
+    assert report["modified_text"] == "Hello 世界"
+    result = stats.stats()
+    assert result["predicted"] == 1
+    assert result["wasted"] + result["cancelled"] == 1
+
+
+def test_string_score_is_coerced(speculative):
+    stats = SpeculationStats()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        report = Proofreader(None, FakeAI(score="90"), stats, executor).proofread_batch([low_score_item()])[0]
+
+    assert "error" not in report
+    assert report["score"] == 90
+    assert "raw_response" not in report
+    assert report["modified_text"] == "Hello 世界"
+    assert stats.stats()["wasted"] + stats.stats()["cancelled"] == 1
+
+
+def test_missing_score_is_flagged(speculative):
+    report = Proofreader(None, FakeAI(score="很好")).proofread_batch([low_score_item()])[0]
+
+    assert "error" not in report
+    assert report["score"] == 0
+    assert "raw_response" in report
+
+
+class FailingCheckAI(FakeAI):
+    """修改请求发出后校对请求失败"""
+
+    def __init__(self):
+        super().__init__(score=0)
+        self.modify_started = threading.Event()
+
+    def chat(self, messages, deadline=None):
+        if "资深翻译编辑" in messages[0]["content"]:
+            self.modify_started.set()
+            return super().chat(messages, deadline)
+        self.modify_started.wait(5)
+        raise ValueError("API请求失败: 502")
+
+
+def test_speculation_spent_before_check_error_is_wasted(speculative):
+    stats = SpeculationStats()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        report = Proofreader(None, FailingCheckAI(), stats, executor).proofread_batch([low_score_item()])[0]
+
+    assert "error" in report
+    result = stats.stats()
+    assert result["predicted"] == 1
+    assert result["wasted"] == 1
+
+
+class WindowAI(FakeAI):
+    """窗口请求中第1行的评分不是数字，单条请求正常返回"""
+
+    def chat(self, messages, deadline=None):
+        content = messages[0]["content"]
+        if "results" in content:
+            with self._lock:
+                self.prompts.append(content)
+            return json.dumps({"results": [
+                {"id": 0, "score": 95, "is_correct": True, "comment": "c"},
+                {"id": 1, "score": "很好", "is_correct": True, "comment": "c"},
+                {"id": 2, "score": 90, "is_correct": True, "comment": "c"},
+            ]})
+        return super().chat(messages, deadline)
+
+
+def test_window_line_without_numeric_score_falls_back(monkeypatch):
+    monkeypatch.setattr(Config, "POLLING_INTERVAL", 0.01)
+    memory = TranslationMemory()
+    memory.add({"source_text": "再见", "target_text": "Bye", "score": 95, "modified_text": "Bye",
+                "is_correct": True, "comment": "ok"})
+    window = [PairItem(0, "甲", "你好", "Hello"), PairItem(1, "甲", "谢谢", "Thanks"),
+              PairItem(2, "乙", "早上好", "Morning"), PairItem(3, "乙", "再见", "Bye")]
+    ai = WindowAI(score=88)
+
+    reports = Proofreader(memory, ai).proofread_window(window)
+
+    assert [r["original_index"] for r in reports] == [0, 1, 2, 3]
+    assert all("error" not in r for r in reports)
+    assert [r["score"] for r in reports] == [95, 88, 90, 95]
+    # 只有评分无效的一行单独重新校对
+    assert sum("翻译校对员" in p and "results" not in p for p in ai.prompts) == 1
+    assert "tm_match" in reports[3]
+
+
+def test_check_only_marks_missing_score_as_failed():
+    item = PairItem(0, "甲", "你好", "Hello")
+
+    report = Proofreader(None, FakeAI(score="很好")).check_only(item)
+    assert report["error"]
+    assert "raw_response" in report
+
+    report = Proofreader(None, FakeAI(score="90")).check_only(item)
+    assert "error" not in report
+    assert report["score"] == 90
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+import sampling
+from config import Config
+from utils import FilePairTable
+
+
+def make_table(n=600, speakers=30, seed=0):
+    """合成文件：说话人按段落连续出现，准确率随说话人递增，原文长短交替"""
+    rng = random.Random(seed)
+    table = FilePairTable([{} for _ in range(n)], "message")
+    truth = {}
+    for i in range(n):
+        speaker = i * speakers // n
+        table.append(i, f"角色{speaker}", "字" * (5 if i % 2 else 20), "x")
+        correct = rng.random() < 0.3 + 0.7 * speaker / (speakers - 1)
+        truth[i] = (correct, 90 if correct else rng.randint(30, 80))
+    return table, truth
+
+
+class FakeProofreader:
+    def __init__(self, truth, fail=()):
+        self.truth = truth
+        self.fail = set(fail)
+
+    def check_only(self, item, deadline=None):
+        correct, score = self.truth[item.index]
+        report = {"original_index": item.index, "score": score, "is_correct": correct}
+        if item.index in self.fail:
+            report["error"] = "校对失败"
+        return report
+
+
+@pytest.mark.parametrize("sample_size", [20, 60])
+def test_confidence_interval_coverage(sample_size, monkeypatch):
+    monkeypatch.setattr(Config, "CONCURRENT_REQUESTS", 1)
+    table, truth = make_table()
+    true_accuracy = sum(c for c, _ in truth.values()) / len(truth) * 100
+    true_score = sum(s for _, s in truth.values()) / len(truth)
+
+    runs = 200
+    covered_accuracy = covered_score = 0
+    for seed in range(runs):
+        result = sampling.sample_file(table, FakeProofreader(truth), sample_size, random.Random(seed))
+        estimate = result["estimate"]
+        assert result["checked"] == sample_size
+        assert estimate["unsampled_share"] == 0
+        covered_accuracy += estimate["accuracy_ci"][0] <= true_accuracy <= estimate["accuracy_ci"][1]
+        covered_score += estimate["average_score_ci"][0] <= true_score <= estimate["average_score_ci"][1]
+
+    # 95%置信区间在小样本正态近似下允许少量偏差
+    assert covered_accuracy / runs >= 0.88
+    assert covered_score / runs >= 0.88
+
+
+def test_small_strata_are_merged():
+    table, _ = make_table()
+    strata = sampling.build_strata(table, 60)
+    allocation = sampling.allocate(strata, 60, random.Random(0))
+
+    assert sum(len(rows) for rows in strata.values()) == len(table)
+    assert len(strata) <= 60 // sampling.MIN_PER_STRATUM + 1
+    assert sum(allocation.values()) == 60
+    assert all(count >= 1 for count in allocation.values())
+
+
+def test_allocation_ties_are_broken_randomly():
+    strata = {i: list(range(i * 10, i * 10 + 10)) for i in range(60)}
+    chosen = set()
+    for seed in range(50):
+        allocation = sampling.allocate(strata, 20, random.Random(seed))
+        assert sum(allocation.values()) == 20
+        chosen.update(key for key, count in allocation.items() if count)
+    assert len(chosen) == 60
+
+
+def test_unsampled_share_is_reported_not_renormalized():
+    reports = {"a": [{"score": 90.0, "is_correct": True}] * 5}
+    estimate = sampling.estimate_file_quality({"a": 50, "b": 50}, reports)
+
+    assert estimate["unsampled_share"] == 0.5
+    # 未覆盖的一半可能全错也可能全对
+    assert estimate["accuracy_ci"] == [50.0, 100.0]
+    assert estimate["average_score_ci"][0] == 45.0
+
+
+def test_failed_samples_leave_unsampled_share(monkeypatch):
+    monkeypatch.setattr(Config, "CONCURRENT_REQUESTS", 1)
+    table, truth = make_table(n=100, speakers=2)
+    # 第二个说话人的条目全部校对失败
+    result = sampling.sample_file(table, FakeProofreader(truth, fail=range(50, 100)), 20, random.Random(1))
+
+    assert result["failed"] > 0
+    assert result["estimate"]["unsampled_share"] == pytest.approx(0.5)
@@ -0,0 +1,117 @@
+import json
+import random
+
+from translation_memory import TranslationMemory, char_ngrams, mask_numbers
+
+
+def make_report(source, target, score=90, modified_text=None, **extra):
+    report = {
+        "source_text": source,
+        "target_text": target,
+        "score": score,
+        "modified_text": modified_text if modified_text is not None else target,
+        "is_correct": True,
+        "comment": "ok"
+    }
+    report.update(extra)
+    return report
+
+
+def brute_force_best(memory, source):
+    grams = char_ngrams(mask_numbers(source)[0], memory.ngram_size)
+    best = 0.0
+    for entry in memory.entries:
+        entry_grams = char_ngrams(mask_numbers(entry.source)[0], memory.ngram_size)
+        best = max(best, 2 * len(grams & entry_grams) / (len(grams) + len(entry_grams)))
+    return best
+
+
+def test_reuse_substitutes_numbers():
+    memory = TranslationMemory()
+    memory.add(make_report("获得3个金币", "Got 3 coins", score=60, modified_text="Received 3 coins"))
+
+    match = memory.lookup("获得12个金币", "Got 12 coins")
+    assert match.reusable
+    assert match.modified_text == "Received 12 coins"
+    # 译文数字没有同步变化时不能复用
+    assert memory.find_reusable("获得12个金币", "Got 3 coins") is None
+
+
+def test_numbers_spelled_as_words_are_not_reused():
+    memory = TranslationMemory()
+    memory.add(make_report("获得3个金币", "Got three coins", score=95))
+
+    match = memory.lookup("获得12个金币", "Got three coins")
+    assert match is not None and not match.reusable
+    # 原样重复仍可复用
+    assert memory.find_reusable("获得3个金币", "Got three coins").reusable
+
+    memory = TranslationMemory()
+    memory.add(make_report("获得3个金币", "Got 3 coins", score=60, modified_text="Received three coins"))
+
+    match = memory.lookup("获得12个金币", "Got 12 coins")
+    assert match is not None and not match.reusable
+
+
+def test_unparsed_results_are_not_approved():
+    assert not TranslationMemory.is_approved(
+        make_report("你好", "Hello", score=0, modified_text="Hi", raw_response="not json"))
+    assert not TranslationMemory.is_approved(
+        make_report("你好", "Hello", score=0, modified_text="Hi", comment="AI响应格式错误"))
+    assert not TranslationMemory.is_approved(make_report("你好", "Hello", score="90"))
+    assert not TranslationMemory.is_approved(make_report("你好", "Hello", error="timeout"))
+    assert TranslationMemory.is_approved(make_report("你好", "Hello", score=60, modified_text="Hi"))
+    assert TranslationMemory.is_approved(make_report("你好", "Hello", score=90))
+
+
+def test_fuzzy_search_matches_brute_force():
+    rng = random.Random(7)
+    chars = [chr(0x4e00 + i) for i in range(60)]
+    sentence = lambda: "".join(rng.choices(chars, k=rng.randint(2, 14)))
+    memory = TranslationMemory()
+    for _ in range(800):
+        text = sentence()
+        memory.add(make_report(text, "t" + text))
+
+    for _ in range(300):
+        query = sentence()
+        threshold = rng.choice([0.3, 0.6, 0.8, 1.0])
+        best = brute_force_best(memory, query)
+        _, similarity = memory._fuzzy_search(query, threshold)
+        assert abs(similarity - (best if best >= threshold else 0.0)) < 1e-9
+
+
+def test_common_grams_do_not_hide_matches():
+    memory = TranslationMemory()
+    # 大量条目共享同一个gram，仍然能找到最相似的条目
+    for i in range(6000):
+        memory.add(make_report(f"你好{chr(0x4e00 + i % 3000)}{chr(0x5000 + i // 3000)}", f"Hello {i}"))
+    memory.add(make_report("你好世界", "Hello world"))
+
+    match = memory.lookup("你好世界！", "Hello world!", context_threshold=0.6)
+    assert match is not None and match.entry.source == "你好世界"
+
+
+def test_index_persists_and_refreshes(tmp_path):
+    report = {"reports": [make_report("获得3个金币", "Got 3 coins"), make_report("打开宝箱", "Open chest")]}
+    (tmp_path / "a_report.json").write_text(json.dumps(report, ensure_ascii=False), encoding="utf-8")
+
+    memory = TranslationMemory.load_or_build(str(tmp_path))
+    assert len(memory) == 2
+    assert (tmp_path / "tm_index.pkl").exists()
+
+    loaded = TranslationMemory.load(str(tmp_path))
+    assert len(loaded) == 2
+    assert loaded.lookup("打开宝箱吧", "Open the chest", context_threshold=0.5).entry.source == "打开宝箱"
+
+    # 新增的报告增量读入，加载后新增的条目与基础层一起参与查询
+    (tmp_path / "b_report.json").write_text(
+        json.dumps({"reports": [make_report("关闭宝箱", "Close chest")]}, ensure_ascii=False), encoding="utf-8")
+    refreshed = TranslationMemory.load_or_build(str(tmp_path))
+    assert len(refreshed) == 3
+    assert refreshed.lookup("关闭宝箱吧", "Close the chest", context_threshold=0.5).entry.source == "关闭宝箱"
+
+    # 报告被删除时完整重建
+    (tmp_path / "a_report.json").unlink()
+    rebuilt = TranslationMemory.load_or_build(str(tmp_path))
+    assert len(rebuilt) == 1
@@ -0,0 +1,91 @@
+import json
+import os
+import random
+
+import pytest
+
+from utils import POSSIBLE_TEXT_FIELDS, detect_text_field, load_file_pair, validate_structure
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_field_resolution_matches_detect_text_field(tmp_path):
+    # 第一条只有text，后面的条目同时有message和text：应与逐条检测一样使用message
+    src = [{"name": "甲", "text": "你好"}, {"name": "甲", "message": "再见", "text": "旧文本"}]
+    tgt = [{"name": "甲", "message": None, "text": "Hello"}, {"name": "甲", "message": "Bye", "text": "old"}]
+    table = load_file_pair(write_json(tmp_path / "zh.json", src), write_json(tmp_path / "en.json", tgt))
+
+    assert table.sources == ["你好", "再见"]
+    assert table.targets == ["Hello", "Bye"]
+    table.set_target_text(1, "Goodbye")
+    assert table.tgt_data[1] == {"name": "甲", "message": "Goodbye", "text": "old"}
+    table.set_target_text(0, "Hi")
+    assert table.tgt_data[0] == {"name": "甲", "message": None, "text": "Hi"}
+
+
+def test_field_resolution_matches_detect_text_field_randomized(tmp_path):
+    rng = random.Random(5)
+
+    def entry(i):
+        item = {"name": "甲"}
+        for field in POSSIBLE_TEXT_FIELDS:
+            roll = rng.random()
+            if roll < 0.3:
+                item[field] = f"{field}{i}"
+            elif roll < 0.4:
+                item[field] = None
+        if detect_text_field(item) is None:
+            item["dialogue"] = f"dialogue{i}"
+        return item
+
+    src = [entry(i) for i in range(300)]
+    tgt = [entry(i) for i in range(300)]
+    table = load_file_pair(write_json(tmp_path / "zh.json", src), write_json(tmp_path / "en.json", tgt), verbose=False)
+
+    assert len(table) == 300
+    for row, index in enumerate(table.indices):
+        assert table.sources[row] == src[index][detect_text_field(src[index])]
+        assert table.targets[row] == tgt[index][detect_text_field(tgt[index])]
+        assert table.target_field_for(index) == detect_text_field(tgt[index])
+
+
+@pytest.mark.parametrize("src, tgt, error", [
+    ([{"text": "你好"}], [], ValueError),
+    ([{"text": "你好"}, {"text": None}], [{"text": "Hi"}, {"text": "Bye"}], KeyError),
+    ([{"text": "你好"}], [{"name": "甲"}], KeyError),
+])
+def test_validate_structure_matches_load_file_pair(tmp_path, src, tgt, error):
+    with pytest.raises(error):
+        validate_structure(src, tgt)
+    with pytest.raises(error):
+        load_file_pair(write_json(tmp_path / "zh.json", src), write_json(tmp_path / "en.json", tgt))
+
+
+def test_save_json_uses_umask_permissions(tmp_path):
+    from utils import save_json
+
+    reference = tmp_path / "reference.json"
+    with open(reference, "w", encoding="utf-8") as f:
+        f.write("{}")
+    path = save_json({"a": 1}, str(tmp_path / "out.json"))
+
+    assert os.stat(path).st_mode & 0o777 == os.stat(reference).st_mode & 0o777
+    assert json.loads(open(path, encoding="utf-8").read()) == {"a": 1}
+
+
+def test_save_json_keeps_existing_permissions(tmp_path):
+    from utils import save_json
+
+    path = tmp_path / "out.json"
+    path.write_text("{}", encoding="utf-8")
+    os.chmod(path, 0o640)
+    save_json({"a": 2}, str(path))
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+    # 切换为gzip格式时新文件按umask创建，旧格式文件被删除
+    gz_path = save_json({"a": 3}, str(path), compress=True)
+    assert gz_path.endswith(".gz") and not path.exists()
+    assert not [p for p in os.listdir(tmp_path) if p.startswith(".tmp_")]
@@ -0,0 +1,26 @@
+from utils import PairItem
+from windowing import build_windows
+
+
+def items(indices, name="甲", source="你好", target="Hello"):
+    return [PairItem(i, name, source, target) for i in indices]
+
+
+def indices(windows):
+    return [[item.index for item in window] for window in windows]
+
+
+def test_non_adjacent_lines_are_not_grouped():
+    # 第3、4条被跳过（空行或已从断点恢复），前后两段不能作为连续对话
+    windows = build_windows(items([0, 1, 2, 5, 6]), max_tokens=10_000, max_lines=20)
+    assert indices(windows) == [[0, 1, 2], [5, 6]]
+
+
+def test_page_break_ends_window():
+    lines = items([0, 1]) + [PairItem(2, "甲", "再见@", "Bye")] + items([3, 4])
+    assert indices(build_windows(lines, max_tokens=10_000, max_lines=20)) == [[0, 1, 2], [3, 4]]
+
+
+def test_cut_prefers_speaker_change():
+    lines = items([0, 1, 2], name="甲") + items([3, 4], name="乙")
+    assert indices(build_windows(lines, max_tokens=10_000, max_lines=4)) == [[0, 1, 2], [3, 4]]
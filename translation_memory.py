@@ -0,0 +1,380 @@
+import glob
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from utils import load_json, intern_str, atomic_write_bytes
+
+# 持久化索引文件（与报告放在同一文件夹），格式变化时递增版本号
+INDEX_FILENAME = "tm_index.pkl"
+INDEX_VERSION = 1
+# 解析失败时_parse_ai_response给出的评语（旧报告没有raw_response字段，据此识别）
+PARSE_ERROR_COMMENT = "AI响应格式错误"
+
+# 数字占位符：只差数字的句子视为同一模板
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+NUMBER_PLACEHOLDER = "{#}"
+
+
+def mask_numbers(text: str):
+    """将文本中的数字替换为占位符，返回(模板, 数字列表)"""
+    numbers = NUMBER_PATTERN.findall(text)
+    return NUMBER_PATTERN.sub(NUMBER_PLACEHOLDER, text), numbers
+
+
+def carries_numbers(text: str, numbers: list):
+    """文本中的数字与numbers一一对应（数量相同且每个数字都出现），数字写成单词时不成立"""
+    return sorted(NUMBER_PATTERN.findall(text)) == sorted(numbers)
+
+
+def char_ngrams(text: str, n: int):
+    """生成字符n-gram集合（去除空白，短文本整体作为一个gram）"""
+    text = re.sub(r'\s+', '', text)
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def substitute_numbers(text: str, old_numbers: list, new_numbers: list):
+    """按原文数字的对应关系替换译文中的数字，映射冲突时返回None"""
+    if len(old_numbers) != len(new_numbers):
+        return None
+    mapping = {}
+    for old, new in zip(old_numbers, new_numbers):
+        if mapping.setdefault(old, new) != new:
+            return None
+    if not mapping:
+        return text
+    return NUMBER_PATTERN.sub(lambda m: mapping.get(m.group(0), m.group(0)), text)
+
+
+class TMEntry:
+    """翻译记忆条目（已审定的原文/译文对及其校对结果）"""
+    __slots__ = ("source", "target", "score", "modified_text",
+                 "is_correct", "style_type", "style_applied", "comment", "changes_reason")
+
+    def __init__(self, source, target, report):
+        self.source = source
+        self.target = target
+        self.score = report.get('score', 0)
+        self.modified_text = report.get('modified_text', target)
+        self.is_correct = report.get('is_correct', False)
+        self.style_type = intern_str(report.get('style_type', '普通翻译'))
+        self.style_applied = intern_str(report.get('style_applied', '未应用'))
+        self.comment = report.get('comment', '')
+        self.changes_reason = report.get('changes_reason', '无修改')
+
+    def to_tuple(self):
+        """持久化用的紧凑表示"""
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    @classmethod
+    def from_tuple(cls, values):
+        entry = cls.__new__(cls)
+        for field, value in zip(cls.__slots__, values):
+            setattr(entry, field, value)
+        entry.style_type = intern_str(entry.style_type)
+        entry.style_applied = intern_str(entry.style_applied)
+        return entry
+
+
+class TMMatch:
+    """翻译记忆查询结果"""
+    __slots__ = ("entry", "similarity", "reusable", "modified_text")
+
+    def __init__(self, entry, similarity, reusable=False, modified_text=None):
+        self.entry = entry
+        self.similarity = similarity
+        self.reusable = reusable
+        self.modified_text = modified_text
+
+    def as_report_info(self):
+        """报告中记录的匹配信息"""
+        return {
+            "similarity": round(self.similarity, 3),
+            "source_text": self.entry.source,
+            "target_text": self.entry.target,
+            "reused": self.reusable
+        }
+
+
+def _is_score(value):
+    """是否为解析得到的数值评分"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class TranslationMemory:
+    """
+    基于历史报告的本地翻译记忆索引
+    - 精确层：数字归一化后的(原文, 译文)哈希表，O(1)命中并复用结果
+    - 模糊层：原文字符n-gram倒排索引，按Dice系数取最相似条目作为参考
+    - 所有结构只追加不删除，写入加锁串行，查询不加锁
+    - 索引持久化到 report/tm_index.pkl，启动时只重新读取有变化的报告
+
+    倒排索引分两层：从磁盘读入的基础层以紧凑数组存放（gram -> 槽位，槽位 -> ids区间），
+    本次运行新增的条目记在增量层 {gram: array}，保存时合并为新的基础层
+    """
+
+    def __init__(self, ngram_size=2):
+        self.ngram_size = ngram_size
+        self.entries = []
+        self._gram_counts = array("l")
+        self._exact = {}
+        self._base_slots = {}
+        self._base_offsets = array("l", (0,))
+        self._base_ids = array("l")
+        self._postings = {}
+        # 已读入的报告文件 {文件名: (修改时间, 大小)}
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def is_approved(report):
+        """
+        历史报告条目是否可作为审定结果（评分达标或已给出修改）
+        校对失败、响应无法解析或没有数值评分的条目不作为审定结果
+        """
+        if report.get('error') or not report.get('source_text') or not report.get('target_text'):
+            return False
+        if 'raw_response' in report or report.get('comment') == PARSE_ERROR_COMMENT:
+            return False
+        score = report.get('score')
+        if not _is_score(score):
+            return False
+        return score >= 85 or report.get('modified_text') != report.get('target_text')
+
+    def add(self, report):
+        """加入一条报告条目，非审定条目忽略"""
+        if not self.is_approved(report):
+            return
+        source = report['source_text']
+        target = report['target_text']
+        entry = TMEntry(source, target, report)
+        key = (mask_numbers(source)[0], mask_numbers(target)[0])
+        grams = char_ngrams(key[0], self.ngram_size)
+
+        with self._lock:
+            entry_id = self._exact.get(key)
+            if entry_id is not None:
+                # 相同模板以最新结果为准，倒排索引无需变化
+                self.entries[entry_id] = entry
+                return
+            # 先追加条目再发布到倒排索引，查询线程读到的编号总是有效的
+            entry_id = len(self.entries)
+            self.entries.append(entry)
+            self._gram_counts.append(len(grams))
+            self._exact[key] = entry_id
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    self._postings[gram] = array("l", (entry_id,))
+                else:
+                    postings.append(entry_id)
+
+    def find_reusable(self, source_text, target_text):
+        """只查精确层：模板完全相同且数字可替换时返回可复用的匹配"""
+        masked_source, source_numbers = mask_numbers(source_text)
+        masked_target = mask_numbers(target_text)[0]
+
+        entry_id = self._exact.get((masked_source, masked_target))
+        if entry_id is None:
+            return None
+        entry = self.entries[entry_id]
+        if source_text == entry.source and target_text == entry.target:
+            # 原样重复的句子无需替换数字
+            return TMMatch(entry, 1.0, reusable=True, modified_text=entry.modified_text)
+        # 译文中的数字也必须与原文同步变化，否则不能沿用历史评分
+        # 译文/修改结果把数字写成单词时无法替换（"three"不会变成"12"），只作参考
+        if not carries_numbers(target_text, source_numbers) or \
+                not carries_numbers(entry.modified_text, NUMBER_PATTERN.findall(entry.source)):
+            return None
+        entry_numbers = NUMBER_PATTERN.findall(entry.source)
+        expected_target = substitute_numbers(entry.target, entry_numbers, source_numbers)
+        modified_text = substitute_numbers(entry.modified_text, entry_numbers, source_numbers)
+        if expected_target != target_text or modified_text is None:
+            return None
+        return TMMatch(entry, 1.0, reusable=True, modified_text=modified_text)
+
+    def lookup(self, source_text, target_text, context_threshold=0.6):
+        """
+        查询最相似的审定条目
+        - 模板完全相同且数字可替换：reusable=True，直接复用评分和修改结果
+        - 原文相似度达到context_threshold：返回匹配作为提示词参考
+        """
+        match = self.find_reusable(source_text, target_text)
+        if match is not None:
+            return match
+
+        masked_source = mask_numbers(source_text)[0]
+        best_id, best_similarity = self._fuzzy_search(masked_source, context_threshold)
+        if best_id is None:
+            return None
+        return TMMatch(self.entries[best_id], best_similarity)
+
+    def _postings_for(self, gram):
+        """gram的倒排表（基础层区间 + 增量层）"""
+        result = []
+        slot = self._base_slots.get(gram)
+        if slot is not None:
+            result.append(self._base_ids[self._base_offsets[slot]:self._base_offsets[slot + 1]])
+        delta = self._postings.get(gram)
+        if delta:
+            result.append(delta)
+        return result
+
+    def _fuzzy_search(self, masked_source, threshold):
+        """
+        在倒排索引中查找Dice系数最高且不低于threshold的条目（前缀过滤，结果精确）
+        Dice = 2·重叠/(查询gram数+条目gram数) ≥ t 要求重叠至少 ⌈t·q/(2-t)⌉ 个gram，
+        因此候选必然出现在最稀有的 q-最小重叠+1 个gram的倒排表中，常见gram只用于验证
+        """
+        grams = char_ngrams(masked_source, self.ngram_size)
+        query_size = len(grams)
+        if not query_size:
+            return None, 0.0
+        threshold = min(max(threshold, 1e-6), 1.0)
+        min_overlap = max(1, math.ceil(threshold * query_size / (2 - threshold) - 1e-9))
+        min_size = min_overlap
+        max_size = math.floor(query_size * (2 - threshold) / threshold + 1e-9)
+
+        # 按倒排表长度从短到长排序，取前缀
+        postings = {gram: self._postings_for(gram) for gram in grams}
+        ordered = sorted(grams, key=lambda gram: sum(len(ids) for ids in postings[gram]))
+        prefix = ordered[:query_size - min_overlap + 1]
+        rest = frozenset(ordered[len(prefix):])
+
+        overlaps = {}
+        gram_counts = self._gram_counts
+        for gram in prefix:
+            for ids in postings[gram]:
+                for entry_id in ids:
+                    if min_size <= gram_counts[entry_id] <= max_size:
+                        overlaps[entry_id] = overlaps.get(entry_id, 0) + 1
+
+        best_id, best_similarity = None, threshold
+        for entry_id, overlap in overlaps.items():
+            total = query_size + gram_counts[entry_id]
+            # 上界：其余gram全部重叠
+            if 2 * (overlap + len(rest)) / total < best_similarity:
+                continue
+            if rest:
+                entry_grams = char_ngrams(mask_numbers(self.entries[entry_id].source)[0], self.ngram_size)
+                overlap += len(rest & entry_grams)
+            similarity = 2 * overlap / total
+            if similarity > best_similarity or (similarity == best_similarity and best_id is None):
+                best_id, best_similarity = entry_id, similarity
+        return best_id, best_similarity if best_id is not None else 0.0
+
+    @staticmethod
+    def _report_paths(report_folder):
+        """单文件报告路径（不含总报告）"""
+        paths = glob.glob(os.path.join(report_folder, "*_report.json"))
+        paths += glob.glob(os.path.join(report_folder, "*_report.json.gz"))
+        return sorted(p for p in paths if not os.path.basename(p).startswith("summary_report.json"))
+
+    def refresh(self, report_folder):
+        """读入新增或有变化的报告（同一模板以最新结果为准），返回读入的报告数"""
+        loaded = 0
+        for path in self._report_paths(report_folder):
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            name = os.path.basename(path)
+            if self._sources.get(name) == signature:
+                continue
+            try:
+                data = load_json(path)
+            except Exception as e:
+                print(f"⚠ 翻译记忆跳过报告 {name}: {e}")
+                continue
+            for report in data.get('reports', []) if isinstance(data, dict) else []:
+                self.add(report)
+            self._sources[name] = signature
+            loaded += 1
+        return loaded
+
+    @classmethod
+    def from_reports(cls, report_folder, **kwargs):
+        """从report文件夹下的单文件报告构建翻译记忆"""
+        memory = cls(**kwargs)
+        memory.refresh(report_folder)
+        return memory
+
+    def _merged_postings(self):
+        """合并基础层和增量层，返回(grams, offsets, ids)"""
+        grams = list(self._base_slots)
+        grams += [gram for gram in self._postings if gram not in self._base_slots]
+        offsets = array("l", (0,))
+        ids = array("l")
+        for gram in grams:
+            for part in self._postings_for(gram):
+                ids.extend(part)
+            offsets.append(len(ids))
+        return grams, offsets, ids
+
+    def save(self, report_folder):
+        """将索引原子写入 report/tm_index.pkl"""
+        with self._lock:
+            grams, offsets, ids = self._merged_postings()
+            state = {
+                "version": INDEX_VERSION,
+                "ngram_size": self.ngram_size,
+                "entries": [entry.to_tuple() for entry in self.entries],
+                "gram_counts": self._gram_counts,
+                "exact": self._exact,
+                "grams": grams,
+                "offsets": offsets,
+                "ids": ids,
+                "sources": dict(self._sources)
+            }
+            payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        path = os.path.join(report_folder, INDEX_FILENAME)
+        atomic_write_bytes(path, payload)
+        return path
+
+    @classmethod
+    def load(cls, report_folder, ngram_size=2):
+        """读取持久化索引，不存在、版本或n-gram长度不符时返回None"""
+        path = os.path.join(report_folder, INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"⚠ 翻译记忆索引无法读取，将重新构建: {e}")
+            return None
+        if state.get("version") != INDEX_VERSION or state.get("ngram_size") != ngram_size:
+            return None
+        memory = cls(ngram_size=ngram_size)
+        memory.entries = [TMEntry.from_tuple(values) for values in state["entries"]]
+        memory._gram_counts = state["gram_counts"]
+        memory._exact = state["exact"]
+        memory._base_slots = {gram: slot for slot, gram in enumerate(state["grams"])}
+        memory._base_offsets = state["offsets"]
+        memory._base_ids = state["ids"]
+        memory._sources = state["sources"]
+        return memory
+
+    @classmethod
+    def load_or_build(cls, report_folder, ngram_size=2):
+        """
+        读取持久化索引并增量读入有变化的报告，有更新时写回索引
+        有报告被删除时无法撤回其条目，改为从现有报告完整重建
+        """
+        memory = cls.load(report_folder, ngram_size)
+        if memory is not None:
+            existing = {os.path.basename(p) for p in cls._report_paths(report_folder)}
+            if not set(memory._sources) <= existing:
+                memory = None
+        if memory is None:
+            memory = cls(ngram_size=ngram_size)
+            memory.refresh(report_folder)
+            memory.save(report_folder)
+        elif memory.refresh(report_folder):
+            memory.save(report_folder)
+        return memory
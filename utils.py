@@ -1,4 +1,16 @@
+import gzip
 import json
+import os
+import stat
+import sys
+import tempfile
+from array import array
+
+# 可选的快速JSON序列化库
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 POSSIBLE_TEXT_FIELDS = ["message", "text", "content", "dialogue"]
 
@@ -13,27 +25,216 @@ def detect_text_field(item: dict):
     return None
 
 def load_json(path: str):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def save_json(data, path: str):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def resolve_json_path(path: str):
+    """返回实际存在的JSON文件路径（兼容gzip压缩的.gz版本），都不存在时返回None"""
+    for candidate in (path, path + ".gz"):
+        if os.path.exists(candidate):
+            return candidate
+    return None
 
-def validate_structure(src: list, tgt: list):
+def dump_json_bytes(data, compact=False, fast=False) -> bytes:
+    """序列化为UTF-8字节，fast=True且安装了orjson时使用orjson"""
+    if fast and orjson is not None:
+        return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2)
+    if compact:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    return text.encode("utf-8")
+
+# 进程的umask（导入时读取一次，os.umask只能通过设置来读取，不宜在写出线程中调用）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _target_mode(path: str):
+    """目标文件已存在时沿用其权限，否则与open()新建文件一致（0o666 & ~umask）"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def _fsync_directory(directory: str):
+    """同步目录项，确保重命名在断电后仍然生效（不支持的平台忽略）"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(path: str, payload: bytes):
+    """
+    原子写入：先写同目录临时文件并落盘，再重命名，中途崩溃或断电不会留下半截文件
+    mkstemp创建的临时文件权限为0600，重命名前改为目标文件原有权限（新文件按umask）
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+def save_json(data, path: str, compact=False, compress=False, fast=False):
+    """
+    原子写入JSON
+    compress=True时写入gzip压缩的 path.gz，并删除另一种格式的旧文件，返回实际写入的路径
+    """
+    payload = dump_json_bytes(data, compact=compact, fast=fast)
+    stale_path = path + ".gz"
+    if compress:
+        stale_path = path
+        path += ".gz"
+        payload = gzip.compress(payload, compresslevel=6)
+
+    atomic_write_bytes(path, payload)
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+    return path
+
+def intern_str(value):
+    """驻留重复出现的短字符串（说话人、风格类型等），非字符串原样返回"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+# 每个字段之前的更高优先级字段
+_HIGHER_PRIORITY_FIELDS = {field: POSSIBLE_TEXT_FIELDS[:i] for i, field in enumerate(POSSIBLE_TEXT_FIELDS)}
+
+def _resolve_text_field(item: dict, cached_field):
+    """
+    与detect_text_field(item)结果一致的字段名
+    缓存字段有值且没有更高优先级的字段有值时直接使用，否则逐个检测
+    """
+    if cached_field is not None and item.get(cached_field) is not None and \
+            all(item.get(field) is None for field in _HIGHER_PRIORITY_FIELDS[cached_field]):
+        return cached_field
+    return detect_text_field(item)
+
+class PairItem:
+    """单条待校对数据"""
+    __slots__ = ("index", "name", "source", "target")
+
+    def __init__(self, index, name, source, target):
+        self.index = index
+        self.name = name
+        self.source = source
+        self.target = target
+
+class FilePairTable:
+    """
+    已加载的文件对（列式存储）
+    - 文本字段名按文件解析一次，个别条目字段不同时单独记录
+    - 序号/说话人/原文/译文分别存放在平行数组中，说话人名称驻留去重
+    - 只保留译文的原始JSON，用于写出修改后的文件
+    """
+    __slots__ = ("indices", "names", "sources", "targets", "target_field",
+                 "target_field_overrides", "tgt_data", "total_entries")
+
+    def __init__(self, tgt_data, target_field):
+        self.indices = array("l")
+        self.names = []
+        self.sources = []
+        self.targets = []
+        self.target_field = target_field
+        self.target_field_overrides = {}
+        self.tgt_data = tgt_data
+        self.total_entries = len(tgt_data)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def append(self, index, name, source, target):
+        self.indices.append(index)
+        self.names.append(intern_str(name))
+        self.sources.append(source)
+        self.targets.append(target)
+
+    def item(self, row: int):
+        """取出第row行作为PairItem"""
+        return PairItem(self.indices[row], self.names[row], self.sources[row], self.targets[row])
+
+    def items(self):
+        for row in range(len(self.indices)):
+            yield self.item(row)
+
+    def target_field_for(self, index: int):
+        """原始译文第index条的文本字段名"""
+        return self.target_field_overrides.get(index, self.target_field)
+
+    def set_target_text(self, index: int, text):
+        """写回修改后的译文"""
+        self.tgt_data[index][self.target_field_for(index)] = text
+
+def _to_text(value):
+    return str(value).strip() if value is not None else ""
+
+def iter_validated_pairs(src: list, tgt: list, verbose=True):
+    """
+    校验文件对结构并逐条返回 (序号, 原文条目, 译文条目, 原文字段, 译文字段)
+    条目数量不一致抛出ValueError，找不到文本字段抛出KeyError
+    文本字段名按首条解析一次，后续条目与detect_text_field结果一致
+    """
     if len(src) != len(tgt):
         raise ValueError(f"❌ 条目数量不一致: {len(src)} != {len(tgt)}")
+
+    source_field = detect_text_field(src[0]) if src else None
+    target_field = detect_text_field(tgt[0]) if tgt else None
     for i, (s, t) in enumerate(zip(src, tgt)):
-        source_field = detect_text_field(s)
-        target_field = detect_text_field(t)
-        if not source_field:
+        s_field = _resolve_text_field(s, source_field)
+        t_field = _resolve_text_field(t, target_field)
+        if not s_field:
             raise KeyError(f"❌ source 第{i}条找不到文本字段 (message/text/content/dialogue)")
-        if not target_field:
+        if not t_field:
             raise KeyError(f"❌ target 第{i}条找不到文本字段 (message/text/content/dialogue)")
+
         source_name = s.get("name")
         target_name = t.get("name")
-        if source_name and target_name and source_name != target_name:
+        if verbose and source_name and target_name and source_name != target_name:
             print(f"⚠ 第{i}条 name 不一致: {source_name} != {target_name}")
+        yield i, s, t, s_field, t_field
+
+def validate_structure(src: list, tgt: list):
+    """只校验结构，不提取文本（与load_file_pair共用同一套检查）"""
+    for _ in iter_validated_pairs(src, tgt):
+        pass
+
+def load_file_pair(zh_file: str, en_file: str, verbose=True):
+    """加载并校验文件对，一次遍历生成FilePairTable（结构异常时抛出ValueError/KeyError）"""
+    src = load_json(zh_file)
+    tgt = load_json(en_file)
+    table = FilePairTable(tgt, detect_text_field(tgt[0]) if tgt else None)
+
+    for i, s, t, s_field, t_field in iter_validated_pairs(src, tgt, verbose):
+        if t_field != table.target_field:
+            table.target_field_overrides[i] = t_field
+
+        source_text = _to_text(s[s_field])
+        target_text = _to_text(t[t_field])
+        if not source_text or not target_text:
+            if verbose:
+                print(f"⚠ 第{i}条文本内容为空，跳过")
+            continue
+        table.append(i, s.get("name"), source_text, target_text)
+
+    return table
 
 def validate_and_extract_text(data_item, field_name):
     """安全地提取和验证文本内容"""
@@ -0,0 +1,62 @@
+from budget import estimate_tokens
+
+# 每行在窗口提示词中的格式开销（序号、说话人、原文/译文标签）
+LINE_OVERHEAD_TOKENS = 12
+# 原文中的@表示换页，视为场景边界
+PAGE_BREAK = "@"
+
+
+def line_tokens(item):
+    """单行在窗口提示词中的估算token数"""
+    return estimate_tokens(item.source) + estimate_tokens(item.target) + estimate_tokens(item.name) + LINE_OVERHEAD_TOKENS
+
+
+def _last_speaker_change(window):
+    """窗口内最后一次说话人切换的位置（0表示没有切换）"""
+    for pos in range(len(window) - 1, 0, -1):
+        if window[pos].name != window[pos - 1].name:
+            return pos
+    return 0
+
+
+def build_windows(items, max_tokens, max_lines):
+    """
+    将连续的条目分组为上下文窗口
+    - 原文含@换页时在该行之后断开
+    - 条目在原文件中不相邻（中间有空行、已完成或已复用的条目被跳过）时断开
+    - 超出token预算或行数上限时，优先在最后一次说话人切换处断开，没有切换才硬切
+    """
+    windows = []
+    current = []
+    tokens = 0
+    for item in items:
+        if current and item.index != current[-1].index + 1:
+            windows.append(current)
+            current = []
+            tokens = 0
+
+        cost = line_tokens(item)
+        while current and (tokens + cost > max_tokens or len(current) >= max_lines):
+            cut = _last_speaker_change(current) or len(current)
+            windows.append(current[:cut])
+            current = current[cut:]
+            tokens = sum(line_tokens(i) for i in current)
+
+        current.append(item)
+        tokens += cost
+        if PAGE_BREAK in item.source:
+            windows.append(current)
+            current = []
+            tokens = 0
+
+    if current:
+        windows.append(current)
+    return windows
+
+
+def format_window_lines(window):
+    """生成窗口提示词中的逐行内容，序号为窗口内位置"""
+    lines = []
+    for pos, item in enumerate(window):
+        lines.append(f"[{pos}] {item.name or '旁白'}\n原文: {item.source}\n译文: {item.target}")
+    return "\n\n".join(lines)
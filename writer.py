@@ -0,0 +1,41 @@
+import queue
+import threading
+from utils import save_json
+
+_STOP = object()
+
+
+class OutputWriter:
+    """
+    后台写出线程：文件处理完成后立即把输出放入队列，
+    由单独的线程序列化并原子写入磁盘，与后续的API请求并行
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self.errors = []
+        self.written = []
+        self._thread = threading.Thread(target=self._run, name="output-writer")
+        self._thread.start()
+
+    def submit(self, data, path, **options):
+        """提交写出任务，options透传给save_json（compact/compress/fast）"""
+        self._queue.put((data, path, options))
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is _STOP:
+                break
+            data, path, options = task
+            try:
+                self.written.append(save_json(data, path, **options))
+            except Exception as e:
+                print(f"❌ 写出失败 {path}: {e}")
+                self.errors.append((path, str(e)))
+
+    def close(self):
+        """等待队列中的写出任务全部完成"""
+        self._queue.put(_STOP)
+        self._thread.join()
+        return self.errors